@@ -1,19 +1,55 @@
+import os
 import time
+import uuid
+from dataclasses import replace
+from frontend import timing
+from frontend.profiler import RerunProfiler
+_timer = timing.start_rerun()
+
 import streamlit as st
 from frontend.scroll import scroll_smooth_once
+from frontend.styles import CSS
 
 
+# google.genai itself is imported lazily, on the first model call
 from backend.genai_backend import (
-    get_client, upload_bytes, stream_model, UploadedRef
+    configure, stream_model, stream_models, UploadedRef, Usage, MODELS
+)
+from backend.ingest import ingest_uploads, sniff_mime, attachment_kind
+from backend.usage_ledger import (
+    UsageLedger, Budget, BudgetExceeded, Estimate, estimate_request, estimate_text_tokens, load_rates
+)
+
+# ---- Env & client (resolved once per process, not on every rerun) ----
+_SETTING_KEYS = (
+    "GEMINI_API_KEY", "AURORA_LEDGER", "AURORA_RATES_FILE",
+    "AURORA_SESSION_BUDGET_USD", "AURORA_DAILY_BUDGET_USD", "AURORA_BUDGET_ACTION",
+    "AURORA_PROFILE", "AURORA_PROFILE_DIR",
 )
 
-# ---- Env & client ----
-API_KEY = st.secrets.get("GEMINI_API_KEY")
-if API_KEY:
-    _ = get_client(api_key=API_KEY)
-else:
-    # We'll warn *after* set_page_config to avoid Streamlit's "must be first" issue.
-    pass
+def _secret(key: str):
+    try:
+        return st.secrets.get(key)
+    except Exception:
+        return None   # no secrets.toml; fall back to the environment
+
+@st.cache_resource(show_spinner=False)
+def _settings() -> dict:
+    return {k: _secret(k) or os.environ.get(k) for k in _SETTING_KEYS}
+
+@st.cache_resource(show_spinner=False)
+def _ledger(path: str | None, rates_file: str | None) -> UsageLedger:
+    return UsageLedger(path, rates=load_rates(rates_file))
+
+SETTINGS = _settings()
+API_KEY = SETTINGS["GEMINI_API_KEY"]
+# Only stores the key; the client is built on first use.
+# We'll warn *after* set_page_config to avoid Streamlit's "must be first" issue.
+configure(API_KEY)
+
+# ---- Usage ledger & budgets (shared across sessions on this machine) ----
+LEDGER = _ledger(SETTINGS["AURORA_LEDGER"], SETTINGS["AURORA_RATES_FILE"])
+BUDGET = Budget.from_env(SETTINGS)
 
 # ------------------ Page setup ------------------
 st.set_page_config(page_title="Aurora Chat", page_icon="💬", layout="wide")
@@ -38,10 +74,21 @@ ss.setdefault("pending_request", None)   # holds the request that will be fulfil
 ss.setdefault("staged_files", [])        # used in the modal before "Attach"
 ss.setdefault("session_file_refs", [])     # list[UploadedRef] persisted across the session
 ss.setdefault("session_file_ids", set())   # to dedupe by file id
+ss.setdefault("session_id", uuid.uuid4().hex)   # ledger key for this browser session
+ss.setdefault("compare_on", False)
+ss.setdefault("compare_models", list(MODELS[:2]))
+
+# ---- Opt-in rerun profiler (no-op unless ?profile=1|sample or AURORA_PROFILE) ----
+_prof = RerunProfiler.start(
+    st.query_params.get("profile") or SETTINGS["AURORA_PROFILE"], ss,
+    out_dir=SETTINGS["AURORA_PROFILE_DIR"], root_file=__file__, t0=_timer.t0,
+)
+_timer.profiler = _prof
 
 def _send_on_enter():
     ss.send_flag = True
 
+
 # ---- Build a lightweight "history" prompt for persistence ----
 def _build_history_prompt(messages, max_turns=6, max_chars=6000) -> str:
     """
@@ -69,130 +116,91 @@ def _build_history_prompt(messages, max_turns=6, max_chars=6000) -> str:
     return history
 
 
+# ---- Billing: ledger + session totals for one model call ----
+def _bill(model: str, usage: Usage | None, estimate: Estimate | None = None) -> tuple[dict, float]:
+    """Records `usage` in the ledger and the session totals; returns (usage dict, cost in USD)."""
+    if usage is None:
+        return {"input": 0, "output": 0, "reasoning": 0, "total": 0}, 0.0
+    cost = LEDGER.record(ss.session_id, model, usage, estimate)
+    ss.usage_totals["input"]     += int(usage.prompt or 0)
+    ss.usage_totals["output"]    += int(usage.response or 0)
+    ss.usage_totals["reasoning"] += int(usage.reasoning or 0)
+    return {"input": usage.prompt or 0, "output": usage.response or 0,
+            "reasoning": usage.reasoning or 0, "total": usage.total or 0}, cost
+
+
+# ---- Compare mode: one prompt, several models, side-by-side columns ----
+def _compare_caption(r: dict) -> str:
+    if r.get("error"):
+        return f"⚠️ {r['error']}"
+    u = r.get("usage") or {}
+    parts = []
+    if r.get("ttft_s") is not None:
+        parts.append(f"TTFT {r['ttft_s']:.2f}s")
+    if r.get("tokens_per_s"):
+        parts.append(f"{r['tokens_per_s']:.0f} tok/s")
+    parts.append(f"{u.get('input', 0)} in / {u.get('output', 0)} out tokens")
+    if r.get("cost_usd"):
+        parts.append(f"${r['cost_usd']:.4f}")
+    return " · ".join(parts)
+
+def _stream_compare(models: list[str], prompt: str, refs: list[UploadedRef],
+                    estimates: dict[str, Estimate]) -> list[dict]:
+    """
+    Streams `prompt` to all `models` concurrently (same uploaded refs) and renders
+    each answer into its own column as it arrives. Records every finished model
+    in the ledger and the session totals; returns one result dict per model.
+    """
+    cols = st.columns(len(models))
+    text_ph, stat_ph = [], []
+    for col, model in zip(cols, models):
+        with col:
+            st.markdown(f"**{model}**")
+            text_ph.append(st.empty())
+            stat_ph.append(st.empty())
+    results = [{"model": m, "text": "", "usage": {}, "ttft_s": None, "tokens_per_s": None,
+                "elapsed_s": None, "cost_usd": 0.0, "retries": 0, "error": ""} for m in models]
+    t0 = time.perf_counter()
+
+    for i, ev in stream_models(models, prompt, uploads=refs):
+        r = results[i]
+        if isinstance(ev, dict) and "error" in ev:
+            exc, usage = ev["error"], ev.get("usage")
+            r["error"] = f"{exc.__class__.__name__}: {exc}"
+            if usage and usage.total:
+                # tokens billed before the failure still count against the budget
+                r["usage"], r["cost_usd"] = _bill(r["model"], usage, estimates.get(r["model"]))
+            if r["text"]:
+                text_ph[i].markdown(r["text"])
+            stat_ph[i].caption(_compare_caption(r))
+        elif isinstance(ev, dict) and "usage" in ev:
+            usage, ttft, elapsed = ev["usage"], ev.get("ttft_s"), ev.get("elapsed_s") or 0.0
+            out_tokens = int(usage.response or 0) or estimate_text_tokens(r["text"])
+            gen_s = elapsed - (ttft or 0.0)
+            r["usage"], r["cost_usd"] = _bill(r["model"], usage, estimates.get(r["model"]))
+            r.update({
+                "ttft_s": ttft,
+                "elapsed_s": elapsed,
+                "tokens_per_s": out_tokens / gen_s if gen_s > 0 else None,
+                "retries": ev["retry"].count if ev.get("retry") else 0,
+            })
+            text_ph[i].markdown(r["text"] or "_(no text response)_")
+            stat_ph[i].caption(_compare_caption(r))
+        else:
+            chunk = str(ev)
+            if not chunk:
+                continue
+            if r["ttft_s"] is None:
+                r["ttft_s"] = time.perf_counter() - t0
+                stat_ph[i].caption(f"TTFT {r['ttft_s']:.2f}s · streaming…")
+            r["text"] += chunk
+            text_ph[i].markdown(r["text"])
+    return results
+
+
 # ------------------ Global CSS ------------------
-CSS = """
-<style>
-header[data-testid="stHeader"] { display: none !important; }
-
-.stApp {
-  background:
-    radial-gradient(1200px 800px at 18% 12%, rgba(99,102,241,0.24), transparent 40%),
-    radial-gradient(1100px 750px at 82% 18%, rgba(255,215,0,0.20), transparent 46%),
-    radial-gradient(950px 650px at 46% 78%, rgba(236,72,153,0.22), transparent 52%),
-    linear-gradient(180deg, #0b0f16 0%, #0a0e14 60%, #0a0e14 100%);
-}
-
-.block-container {
-  padding-top: 0px;
-  padding-bottom: 15px;
-  padding-left: 20px;
-  padding-right: 20px;
-  max-width: 1500px;
-}
-
-.header-row { margin-top: .25rem; }
-.model-box .stSelectbox, .model-box .stSelectbox > div, .model-box div[data-baseweb="select"] {
-  min-width: 260px !important;
-  max-width: 260px !important;
-}
-.header-right { display:flex; justify-content:flex-end; align-items:center; }
-
-.brand {
-  font-weight: 800; font-size: 40px; letter-spacing: .3px;
-  background: linear-gradient(90deg, #7c3aed 0%, #f59e0b 100%);
-  -webkit-background-clip: text; -webkit-text-fill-color: transparent;
-  display: flex; justify-content: center; align-items: center;
-  height: 100px;
-}
-
-/* Fixed composer (single definition) */
-.composer-shell{
-  position: fixed; left:0; right:0; bottom:0; z-index:3000; transform: translateZ(0);
-  background: linear-gradient(180deg, rgba(10,14,20,0.00) 0%, rgba(10,14,20,0.72) 35%, rgba(10,14,20,0.96) 100%);
-  padding: 10px 0 calc(env(safe-area-inset-bottom,0) + 10px);
-}
-.composer-inner{ max-width: min(1200px, 96vw); width: 100%; margin: 0 auto; }
-
-.composer-inner > div[data-testid="stAppViewContainer"] > .st-emotion-cache-1jicfl2 {
-  background:rgba(255,255,255,0.04) !important;
-  border:1px solid rgba(255,255,255,0.10) !important;
-  border-radius: 16px !important;
-}
-
-/* Row: ＋ | input | Send */
-.plus-btn button { width: 46px; height: 46px; border-radius: 12px; padding: 0; }
-.badge{ display:inline-flex; align-items:center; justify-content:center;
-  min-width:18px; height:18px; padding:0 4px; font-size:11px; border-radius:999px;
-  background:#ef4444; color:#fff; margin-left:6px; }
-
-.composer-input [data-testid="stTextInput"] > div { width: 100% !important; }
-.composer-input input[type="text"]{
-  width: 100% !important;
-  height: 46px !important;
-  line-height: 46px !important;
-  border-radius: 12px; padding: 0 12px; font-size: 16px;
-}
-
-/* Send button */
-.send-btn button{
-  height: 46px !important; border-radius: 999px; border: none;
-  background: linear-gradient(90deg, #7c3aed 0%, #f59e0b 100%);
-  color: white; font-weight: 600;
-}
-.send-btn button:hover{ filter: brightness(1.05); }
-
-/* Pre-send preview area */
-.staged-preview {
-  margin-top: 8px; display: flex; gap: 8px; flex-wrap: wrap;
-}
-.staged-pill {
-  background: rgba(255,255,255,0.06); border:1px solid rgba(255,255,255,0.12);
-  border-radius: 12px; padding: 6px 10px; font-size: 13px;
-}
-
-/* small preview bar for attached files (shows in composer before send) */
-.preview-bar {
-  display: flex; gap: 8px; align-items: center; flex-wrap: wrap;
-  margin-bottom: 6px;
-}
-.preview-pill {
-  display:inline-flex; align-items:center; gap:8px;
-  padding: 6px 10px; border-radius: 999px;
-  background: rgba(255,255,255,0.06);
-  border:1px solid rgba(255,255,255,0.10);
-  font-size: 13px;
-}
-.preview-thumb { width: 24px; height: 24px; object-fit: cover; border-radius: 6px; }
-
-/* floating scroll-to-bottom button */
-.scroll-down-btn{
-  position: fixed; right: 18px; bottom: 86px;
-  z-index: 9999;                       /* above composer */
-  border: 0; border-radius: 999px; padding: 10px 12px;
-  background: linear-gradient(90deg, #7c3aed 0%, #f59e0b 100%);
-  color: #fff; font-weight: 700; box-shadow: 0 6px 18px rgba(0,0,0,.35);
-  cursor: pointer;
-  opacity: 1; transform: scale(1); transition: opacity .18s, transform .18s;
-  pointer-events: auto;
-}
-.scroll-down-btn.hidden{
-  opacity: 0; transform: scale(.96); pointer-events: none;
-}
-.scroll-down-btn:hover{ filter:brightness(1.05); }
-
-/* thinking loader: three pulsing dots */
-@keyframes blink { 0%{opacity:.2} 20%{opacity:1} 100%{opacity:.2} }
-.dot { animation: blink 1.4s infinite both; }
-.dot:nth-child(2){ animation-delay: .2s; }
-.dot:nth-child(3){ animation-delay: .4s; }
-
-.hero-inner {
-  text-align: center;
-}
-
-</style>
-"""
 st.markdown(CSS, unsafe_allow_html=True)
+_timer.mark("setup")
 
 # ------------------ Header ------------------
 st.markdown('<div class="header-row">', unsafe_allow_html=True)
@@ -205,16 +213,15 @@ with left:
     st.markdown('<div class="model-box">', unsafe_allow_html=True)
     model_choice = st.selectbox(
         "Model",
-        options=[
-            "gemini-2.5-flash",
-            "gemini-2.5-pro",
-            "gemini-2.5-flash-preview-09-2025",
-            "gemini-2.0-flash"
-        ],
+        options=MODELS,
         index=0,
         help="Choose a Gemini model."
     )
     ss.model_choice = model_choice
+    if st.toggle("Compare models", key="compare_on",
+                 help="Send the same prompt and files to several models at once."):
+        st.multiselect("Models to compare", options=MODELS, key="compare_models",
+                       max_selections=4, label_visibility="collapsed")
     st.markdown('</div>', unsafe_allow_html=True)
 
 with right:
@@ -225,6 +232,13 @@ with right:
         c1.metric("Input", int(ss.usage_totals["input"]))
         c2.metric("Output", int(ss.usage_totals["output"]))
         c3.metric("Reasoning", int(ss.usage_totals["reasoning"]))
+        d1, d2 = st.columns(2)
+        session_usd = LEDGER.spent(session_id=ss.session_id)
+        today_usd = LEDGER.spent(day=time.strftime("%Y-%m-%d"))
+        d1.metric("Session cost", f"${session_usd:.4f}",
+                  help=f"Budget: ${BUDGET.session_usd:.2f}" if BUDGET.session_usd is not None else "No session budget")
+        d2.metric("Today (all sessions)", f"${today_usd:.4f}",
+                  help=f"Budget: ${BUDGET.daily_usd:.2f}" if BUDGET.daily_usd is not None else "No daily budget")
     st.markdown('<div class="header-right">', unsafe_allow_html=True)
     
     # Add two mini buttons: Clear Pins and Usage
@@ -242,6 +256,8 @@ st.markdown('</div>', unsafe_allow_html=True)
 
 
 
+_timer.mark("header")
+
 # ------------------ Greeting + suggestions (first run only) ------------------
 if not ss.first_message_sent and len(ss.messages) == 0:
     st.markdown("""
@@ -269,8 +285,20 @@ if not ss.first_message_sent and len(ss.messages) == 0:
 # ------------------ Chat Timeline ------------------
 for m in ss.messages:
     with st.chat_message(m["role"]):
-        if m.get("text"):
+        if m.get("compare"):
+            for col, r in zip(st.columns(len(m["compare"])), m["compare"]):
+                with col:
+                    st.markdown(f"**{r['model']}**")
+                    if r.get("text"):
+                        st.markdown(r["text"])
+                    st.caption(_compare_caption(r))
+        elif m.get("text"):
             st.markdown(m["text"])
+        if m.get("budget_note"):
+            st.caption(f"💸 {m['budget_note']}")
+        for r in m.get("ingest") or []:
+            saved = f" → {r['bytes'] / 1e6:.2f} MB ({', '.join(r['steps'])})" if r["saved_bytes"] > 0 else ""
+            st.caption(f"📤 {r['name']}: {r['original_bytes'] / 1e6:.2f} MB{saved}, uploaded in {r['upload_s']:.1f}s")
 
         # Show attachments for USER messages inside the bubble
         if m.get("role") == "user":
@@ -291,6 +319,8 @@ for m in ss.messages:
 
 
 
+_timer.mark("timeline")
+
 # ------------------ Pending request: show "Thinking..." and fulfill (STREAMING) ------------------
 if ss.get("pending_request"):
     req = ss.pending_request
@@ -308,111 +338,177 @@ if ss.get("pending_request"):
         uploaded_refs: list[UploadedRef] = []
         # include files that are already pinned in the session
         session_refs: list[UploadedRef] = list(ss.session_file_refs or [])
+        full_text = ""
+        ingest_reports = []
+        decision = None
         try:
-            for a in (req.get("attachments") or []):
-                # Ensure dict shape — avoids "tuple indices" if something odd slipped in
-                if not isinstance(a, dict):
-                    continue
-                name = a.get("name", "file.bin")
-                data = a.get("preview")
-                if not isinstance(data, (bytes, bytearray)):
-                    continue
-
-                lname = name.lower()
-                mime = (
-                    "image/png" if lname.endswith(".png") else
-                    "image/jpeg" if lname.endswith((".jpg", ".jpeg")) else
-                    "image/webp" if lname.endswith(".webp") else
-                    "audio/mpeg" if lname.endswith(".mp3") else
-                    "audio/wav"  if lname.endswith(".wav") else
-                    "audio/mp4"  if lname.endswith(".m4a") else
-                    "application/pdf" if lname.endswith(".pdf") else
-                    "application/octet-stream"
+            # prepend short history so the model remembers the last turns
+            prompt_text = (req.get("history") or "You are a helpful AI assistant.") \
+                        + "\n\nUser: " + req["text"] + "\nAssistant:"
+
+            # pre-flight: price the request and enforce budgets before anything is uploaded
+            est_files = [
+                (sniff_mime(a["preview"], a.get("name")), len(a["preview"]), a["preview"])
+                for a in (req.get("attachments") or [])
+                if isinstance(a, dict) and isinstance(a.get("preview"), (bytes, bytearray))
+            ]
+            est_files += [
+                (getattr(r.file_obj, "mime_type", None) or r.mime_type,
+                 int(getattr(r.file_obj, "size_bytes", 0) or 0), None)
+                for r in session_refs
+            ]
+            compare = req.get("compare") or []
+            if compare:
+                # every model runs, so budget the sum; downgrading one column would defeat the comparison
+                estimates = {m: estimate_request(m, prompt_text, est_files, rates=LEDGER.rates) for m in compare}
+                estimate = Estimate(
+                    sum(e.input_tokens for e in estimates.values()),
+                    sum(e.output_tokens for e in estimates.values()),
+                    sum(e.cost_usd for e in estimates.values()),
                 )
-                uploaded_refs.append(upload_bytes(name, data, mime))
-                # ---- pin uploaded file in session for persistence across turns ----
-                last = uploaded_refs[-1]
-                # Build a small set of existing ids (fallback to object id if API doesn't expose .id)
-                existing_ids = {
-                    (getattr(r.file_obj, "id", None) or str(id(r.file_obj)))
-                    for r in (ss.session_file_refs or [])
-                }
-                new_id = (getattr(last.file_obj, "id", None) or str(id(last.file_obj)))
-                if new_id not in existing_ids:
-                    ss.session_file_refs.append(last)
-                # cap to last 6 files to avoid unbounded growth
-                ss.session_file_refs = ss.session_file_refs[-6:]
+                decision = LEDGER.check(ss.session_id, req["model"], estimate,
+                                        replace(BUDGET, on_exceed="block"))
+            else:
+                estimate = estimate_request(req["model"], prompt_text, est_files, rates=LEDGER.rates)
+                decision = LEDGER.check(ss.session_id, req["model"], estimate, BUDGET)
+            if decision.action == "block":
+                raise BudgetExceeded(decision.reason)
+            if decision.action == "downgrade":
+                req["model"] = decision.model
+                st.caption(f"💸 {decision.reason}")
+
+            with _prof.section("uploads"):
+                to_upload = [
+                    (a.get("name", "file.bin"), bytes(a["preview"]))
+                    for a in (req.get("attachments") or [])
+                    # Ensure dict shape — avoids "tuple indices" if something odd slipped in
+                    if isinstance(a, dict) and isinstance(a.get("preview"), (bytes, bytearray))
+                ]
+                # sniff type, shrink WAV audio, upload (reports bytes saved + upload time);
+                # runs on worker threads so preparing one file overlaps uploading another
+                for ref, report in ingest_uploads(to_upload):
+                    uploaded_refs.append(ref)
+                    ingest_reports.append(report.as_dict())
+                    # ---- pin uploaded file in session for persistence across turns ----
+                    last = uploaded_refs[-1]
+                    # Build a small set of existing ids (fallback to object id if API doesn't expose .id)
+                    existing_ids = {
+                        (getattr(r.file_obj, "id", None) or str(id(r.file_obj)))
+                        for r in (ss.session_file_refs or [])
+                    }
+                    new_id = (getattr(last.file_obj, "id", None) or str(id(last.file_obj)))
+                    if new_id not in existing_ids:
+                        ss.session_file_refs.append(last)
+                    # cap to last 6 files to avoid unbounded growth
+                    ss.session_file_refs = ss.session_file_refs[-6:]
 
             # STREAM!
-            full_text = ""
             final_usage = None
+            retry_stats = None
 
             # union: previously pinned files + just-uploaded
             all_refs = (session_refs + uploaded_refs) if session_refs else uploaded_refs
 
-            # prepend short history so the model remembers the last turns
-            prompt_text = (req.get("history") or "You are a helpful AI assistant.") \
-                        + "\n\nUser: " + req["text"] + "\nAssistant:"
-
-            for ev in stream_model(req["model"], prompt_text, uploads=all_refs):
-                if isinstance(ev, dict) and "usage" in ev:
-                    final_usage = ev["usage"]
-                    break
-                # ev is a chunk of text
-                chunk = str(ev)
-                if chunk:
-                    full_text += chunk
-                    ph.markdown(full_text)
-                    # keep view following while streaming (no timers)
-                    #scroll_smooth_once()
-            scroll_smooth_once()
-            # 3) replace the thinking bubble with the final streamed content in history
-            ss.messages.append({
-                "role": "assistant",
-                "text": full_text or "_(no text response)_",
-                "attachments": [],
-                "model": req["model"],
-                "usage": {
-                    "input": final_usage.prompt if final_usage else 0,
-                    "output": final_usage.response if final_usage else 0,
-                    "reasoning": final_usage.reasoning if final_usage else 0,
-                    "total": final_usage.total if final_usage else 0
-                },
-                "ts": time.time()
-            })
-            
-            if final_usage:
-                ss.usage_totals["input"]     += int(final_usage.prompt or 0)
-                ss.usage_totals["output"]    += int(final_usage.response or 0)
-                ss.usage_totals["reasoning"] += int(final_usage.reasoning or 0)
-            scroll_smooth_once()
+            if compare:
+                ph.empty()
+                with _prof.section("stream"):
+                    results = _stream_compare(compare, prompt_text, all_refs, estimates)
+                scroll_smooth_once()
+                ok = [r for r in results if not r["error"]]
+                ss.messages.append({
+                    "role": "assistant",
+                    # the history prompt only carries one answer: the first model that succeeded
+                    "text": ok[0]["text"] if ok else "",
+                    "attachments": [],
+                    "model": " vs ".join(compare),
+                    "compare": results,
+                    "usage": {k: sum(int(r["usage"].get(k, 0) or 0) for r in results)
+                              for k in ("input", "output", "reasoning", "total")},
+                    "cost_usd": sum(r["cost_usd"] for r in results),
+                    "estimated_cost_usd": decision.estimate.cost_usd,
+                    "ingest": ingest_reports,
+                    "ts": time.time()
+                })
+            else:
+                with _prof.section("stream"):
+                    for ev in stream_model(req["model"], prompt_text, uploads=all_refs):
+                        if isinstance(ev, dict) and "usage" in ev:
+                            final_usage = ev["usage"]
+                            retry_stats = ev.get("retry")
+                            break
+                        # ev is a chunk of text
+                        chunk = str(ev)
+                        if chunk:
+                            full_text += chunk
+                            ph.markdown(full_text)
+                            # keep view following while streaming (no timers)
+                            #scroll_smooth_once()
+                scroll_smooth_once()
+                usage, cost = _bill(req["model"], final_usage, decision.estimate)
+                # 3) replace the thinking bubble with the final streamed content in history
+                ss.messages.append({
+                    "role": "assistant",
+                    "text": full_text or "_(no text response)_",
+                    "attachments": [],
+                    "model": req["model"],
+                    "usage": usage,
+                    "cost_usd": cost,
+                    "estimated_cost_usd": decision.estimate.cost_usd,
+                    "budget_note": decision.reason if decision.action == "downgrade" else "",
+                    "ingest": ingest_reports,
+                    "retries": {
+                        "count": retry_stats.count if retry_stats else 0,
+                        "wait_s": round(retry_stats.wait_s, 3) if retry_stats else 0.0,
+                        "added_latency_s": round(retry_stats.added_latency_s, 3) if retry_stats else 0.0,
+                    },
+                    "ts": time.time()
+                })
+                scroll_smooth_once()
 
 
         except Exception as exc:
             kind = exc.__class__.__name__
             msg  = str(exc)
             friendly = "The model is unavailable at the moment."
-            if "429" in msg or "ResourceExhausted" in msg:
+            if isinstance(exc, BudgetExceeded):
+                friendly = "This request would go over the usage budget. Try a shorter prompt, fewer files, or wait until tomorrow."
+            elif "429" in msg or "ResourceExhausted" in msg:
                 friendly = "This model is currently rate-limited. Try again in a moment or switch models."
             elif "503" in msg or "Service Unavailable" in msg:
                 friendly = "Service is temporarily unavailable. Retrying later usually helps."
             elif "400" in msg:
                 friendly = "The request wasn’t accepted. Please simplify the prompt or try a different file."
 
-            ph.markdown(f"⚠️ {friendly}\n\n`{kind}: {msg}`")
-
+            # keep whatever was streamed before retries ran out
+            err_text = f"⚠️ {friendly}\n\n`{kind}: {msg}`"
+            if full_text:
+                err_text = f"{full_text}\n\n---\n{err_text}"
+            ph.markdown(err_text)
+
+            # tokens billed by failed attempts still count against the budget
+            partial_usage = getattr(exc, "usage", None)
+            retry_stats = getattr(exc, "retry", None)
+            usage, cost = _bill(req["model"], partial_usage if partial_usage and partial_usage.total else None,
+                                decision.estimate if decision else None)
             ss.messages.append({
                 "role": "assistant",
-                "text": f"⚠️ {friendly}\n\n`{kind}: {msg}`",
+                "text": err_text,
                 "attachments": [],
                 "model": req["model"],
-                "usage": {},
+                "usage": usage,
+                "cost_usd": cost,
+                "retries": {
+                    "count": retry_stats.count if retry_stats else 0,
+                    "wait_s": round(retry_stats.wait_s, 3) if retry_stats else 0.0,
+                    "added_latency_s": round(retry_stats.added_latency_s, 3) if retry_stats else 0.0,
+                },
                 "ts": time.time()
             })
             scroll_smooth_once()
 
         finally:
             ss.pending_request = None
+            _prof.flush()
             st.rerun()
 
 # === Bottom sentinel (anchor for smooth scroll) ===
@@ -435,8 +531,7 @@ def attach_modal():
     if files:
         for f in files:
             data = f.read()
-            ext = (f.name.split(".")[-1] or "").lower()
-            typ = "image" if ext in ["png","jpg","jpeg","webp"] else ("audio" if ext in ["mp3","wav","m4a"] else "pdf")
+            typ = attachment_kind(sniff_mime(data, f.name))
             staged.append({"type": typ, "name": f.name, "preview": data, "file_id": None})
 
     # Remember the staged selection in state so rerenders of the dialog don't lose it
@@ -478,20 +573,21 @@ with st.container(border=True):
     # --- show previews for files the user attached (before sending) ---
     if ss.pending_attachments:
         st.markdown("<div class='preview-bar'>", unsafe_allow_html=True)
-        for a in ss.pending_attachments:
-            # tiny image thumb if it's an image, otherwise just a pill
-            if a["type"] == "image":
-                # small inline <img> using base64
-                import base64
-                b64 = base64.b64encode(a["preview"]).decode("ascii")
-                st.markdown(
-                    f"<span class='preview-pill'>"
-                    f"<img class='preview-thumb' src='data:image/*;base64,{b64}'/>"
-                    f"{a['name']}</span>",
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.markdown(f"<span class='preview-pill'>📎 {a['name']}</span>", unsafe_allow_html=True)
+        with _prof.section("thumbnails"):
+            for a in ss.pending_attachments:
+                # tiny image thumb if it's an image, otherwise just a pill
+                if a["type"] == "image":
+                    # small inline <img> using base64
+                    import base64
+                    b64 = base64.b64encode(a["preview"]).decode("ascii")
+                    st.markdown(
+                        f"<span class='preview-pill'>"
+                        f"<img class='preview-thumb' src='data:image/*;base64,{b64}'/>"
+                        f"{a['name']}</span>",
+                        unsafe_allow_html=True,
+                    )
+                else:
+                    st.markdown(f"<span class='preview-pill'>📎 {a['name']}</span>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
     col_plus, col_text, col_send = st.columns([0.05, 0.89, 0.20], gap="small")
@@ -521,6 +617,25 @@ with st.container(border=True):
         st.markdown('</div>', unsafe_allow_html=True)
 
 st.markdown('</div></div>', unsafe_allow_html=True)
+_timer.mark("composer")
+
+# ------------------ Startup / rerun timing (?timing=1) ------------------
+# Runs that end in st.rerun() before this point (e.g. the streaming turn) are not recorded.
+_timer.finish()
+if st.query_params.get("timing"):
+    with st.expander("⏱ Startup & rerun timing", expanded=True):
+        st.json(timing.report())
+
+# ------------------ Profiler debug panel (?profile=1 / ?profile=sample) ------------------
+_prof.flush()
+if _prof.enabled:
+    with st.expander("🔬 Rerun profile (this session)", expanded=True):
+        st.table(_prof.table())
+        st.caption(f"Flamegraph-compatible stacks: `{os.path.abspath(_prof.out_dir)}/{_prof.session_id}.*.folded`")
+        if _prof.sampler is not None:
+            top = _prof.sampler.counts.most_common(5)
+            st.write("Hottest sampled stacks (this run):")
+            st.code("\n".join(f"{n:>5}  {stack}" for stack, n in top) or "(no samples)")
 
 # ------------------ Send Handler (Enter or button) ------------------
 should_send = ss.send_flag or send_click
@@ -549,12 +664,17 @@ if should_send and ss.composer_input_value.strip():
             continue
         hist.append({"role": m.get("role", "user"), "text": m["text"]})
 
+    with _prof.section("history"):
+        history_prompt = _build_history_prompt(ss.messages)
+
     ss.pending_request = {
     "text": text,
     "attachments": msg_attachments,
     "model": ss.model_choice,
-    "history": _build_history_prompt(ss.messages)  # <-- NEW
+    "history": history_prompt  # <-- NEW
     }
+    if ss.compare_on and len(ss.compare_models) >= 2:
+        ss.pending_request["compare"] = list(ss.compare_models)
 
     # 3) clear composer immediately
     ss.composer_input_value = ""
@@ -0,0 +1,502 @@
+# backend/batch_cli.py
+"""
+Headless batch runner over the same backend the Streamlit app uses.
+
+    python -m backend.batch_cli jobs.jsonl -o results.jsonl [--workers 4] [--rpm 60]
+                                [--stream] [--batch] [--fake]
+
+Each input line is a JSON job:
+    {"id": "q1", "prompt": "Summarise this", "model": "gemini-2.5-flash",
+     "attachments": ["docs/report.pdf"]}
+`id` defaults to the line number, `model` to --model, and attachment paths are
+resolved relative to the jobs file.
+
+Each output line is a result:
+    {"id", "model", "mode", "ok", "text", "error", "usage": {input, output,
+     reasoning, total}, "latency_s", "ts"}
+The output file doubles as the checkpoint: on restart, jobs that already have
+an ok result are skipped (pass --fresh to start over).
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from backend.genai_backend import (
+    Usage, UploadedRef, get_client, set_client, call_model, stream_model, fill_usage, is_transient,
+    retry_delay,
+)
+from backend.ingest import IngestReport, ingest_upload
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+MAX_RETRIES = 4   # per sync job, same as stream_model's default
+
+@dataclass
+class Job:
+    id: str
+    prompt: str
+    model: str
+    attachments: list[str] = field(default_factory=list)
+
+
+class RateLimiter:
+    """
+    Shared requests-per-minute limiter for all workers.
+    Spaces calls evenly (one slot every 60/rpm seconds); rpm <= 0 disables it.
+    """
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UploadCache:
+    """
+    Uploads each distinct file content once (keyed by sha256).
+    Concurrent requests for the same content wait on the first upload.
+    """
+    def __init__(self):
+        self._refs: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reports: list[IngestReport] = []
+
+    def get(self, path: str) -> UploadedRef:
+        with open(path, "rb") as fh:
+            data = fh.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            fut = self._refs.get(digest)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._refs[digest] = fut
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return fut.result()
+        try:
+            ref, report = ingest_upload(os.path.basename(path), data)
+        except BaseException as e:
+            # Let a later job retry this file instead of caching the failure
+            with self._lock:
+                self._refs.pop(digest, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self.reports.append(report)
+        fut.set_result(ref)
+        return ref
+
+
+class ResultWriter:
+    """Appends one JSON line per result and flushes, so progress survives a crash."""
+    def __init__(self, path: str, fresh: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = open(path, "w" if fresh else "a", encoding="utf-8")
+
+    def write(self, rec: dict) -> None:
+        line = json.dumps(rec, ensure_ascii=False)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+# ---- Job I/O ----------------------------------------------------------------
+
+def load_jobs(path: str, default_model: str) -> list[Job]:
+    base = os.path.dirname(os.path.abspath(path))
+    jobs: list[Job] = []
+    seen: set[str] = set()
+    with open(path, encoding="utf-8") as fh:
+        for lineno, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                d = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{lineno}: invalid JSON ({e})") from e
+            if not d.get("prompt"):
+                raise ValueError(f"{path}:{lineno}: job has no 'prompt'")
+            jid = str(d.get("id") or lineno)
+            if jid in seen:
+                raise ValueError(f"{path}:{lineno}: duplicate job id {jid!r}")
+            seen.add(jid)
+            atts = [a if os.path.isabs(a) else os.path.join(base, a) for a in d.get("attachments") or []]
+            jobs.append(Job(id=jid, prompt=d["prompt"], model=d.get("model") or default_model, attachments=atts))
+    return jobs
+
+def load_done(path: str) -> set[str]:
+    """Ids that already have a successful result in the output file."""
+    done: set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line after a crash
+            if rec.get("ok"):
+                done.add(str(rec.get("id")))
+    return done
+
+def _usage_dict(u: Optional[Usage]) -> dict:
+    u = u or Usage()
+    return {"input": u.prompt, "output": u.response, "reasoning": u.reasoning, "total": u.total}
+
+def _result(job: Job, mode: str, started: float, text: str = "", usage: Optional[Usage] = None,
+            error: Optional[BaseException | str] = None) -> dict:
+    if isinstance(error, BaseException):
+        error = f"{error.__class__.__name__}: {error}"
+    return {
+        "id": job.id,
+        "model": job.model,
+        "mode": mode,
+        "ok": error is None,
+        "text": text,
+        "error": error,
+        "usage": _usage_dict(usage),
+        "latency_s": round(time.monotonic() - started, 3),
+        "ts": time.time(),
+    }
+
+
+# ---- Sync / stream workers --------------------------------------------------
+
+def _call_with_retry(job: Job, refs: list[UploadedRef], limiter: RateLimiter,
+                     max_retries: int = MAX_RETRIES) -> tuple[str, Usage, int]:
+    """
+    call_model with the same transient retry as stream_model (429/5xx, jittered
+    backoff honouring Retry-After). Every attempt takes a rate-limiter slot.
+    """
+    attempt = 0
+    while True:
+        limiter.wait()
+        try:
+            text, usage = call_model(job.model, job.prompt, uploads=refs)
+            return text, usage, attempt
+        except Exception as e:
+            if attempt >= max_retries or not is_transient(e):
+                raise
+            time.sleep(retry_delay(attempt, e))
+            attempt += 1
+
+def run_job(job: Job, uploads: UploadCache, limiter: RateLimiter, stream: bool) -> dict:
+    started = time.monotonic()
+    mode = "stream" if stream else "sync"
+    try:
+        refs = [uploads.get(p) for p in job.attachments]
+        if not stream:
+            text, usage, retries = _call_with_retry(job, refs, limiter)
+            rec = _result(job, mode, started, text, usage)
+            if retries:
+                rec["retries"] = retries
+            return rec
+        limiter.wait()
+        text, usage, retry = "", None, None
+        for ev in stream_model(job.model, job.prompt, uploads=refs):
+            if isinstance(ev, dict) and "usage" in ev:
+                usage = ev["usage"]
+                retry = ev.get("retry")
+                break
+            text += str(ev)
+        rec = _result(job, mode, started, text, usage)
+        if retry:
+            rec["retries"] = retry.count
+        return rec
+    except Exception as e:
+        return _result(job, mode, started, error=e)
+
+def run_pool(jobs: list[Job], writer: ResultWriter, workers: int, rpm: float, stream: bool,
+             uploads: UploadCache) -> list[dict]:
+    limiter = RateLimiter(rpm)
+    results: list[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(run_job, j, uploads, limiter, stream) for j in jobs]
+        # record in completion order so the checkpoint never lags behind a slow job
+        for fut in as_completed(futures):
+            rec = fut.result()
+            writer.write(rec)
+            results.append(rec)
+            _progress(rec, len(results), len(jobs))
+    return results
+
+
+# ---- Gemini Batch mode ------------------------------------------------------
+
+_BATCH_DONE = ("JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED",
+               "JOB_STATE_EXPIRED", "JOB_STATE_PARTIALLY_SUCCEEDED")
+
+def _state_name(state: Any) -> str:
+    return str(getattr(state, "name", None) or state or "").split(".")[-1].upper()
+
+def _inline_request(job: Job, refs: list[UploadedRef]) -> dict:
+    parts: list[dict] = [{"text": job.prompt}]
+    for r in refs:
+        f = r.file_obj
+        parts.append({"file_data": {
+            "file_uri": getattr(f, "uri", None),
+            "mime_type": getattr(f, "mime_type", None) or r.mime_type,
+        }})
+    return {"contents": [{"role": "user", "parts": parts}]}
+
+def _pending_path(out_path: str) -> str:
+    return out_path + ".batches.json"
+
+def _load_pending(out_path: str) -> dict[str, list[str]]:
+    try:
+        with open(_pending_path(out_path), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def _save_pending(out_path: str, pending: dict[str, list[str]]) -> None:
+    tmp = _pending_path(out_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(pending, fh)
+    os.replace(tmp, _pending_path(out_path))
+
+def _batch_results(name: str, bj: Any, state: str, ids: list[str], by_id: dict[str, Job],
+                   writer: ResultWriter, started: float) -> list[dict]:
+    """
+    Writes one result per job of a finished batch. `ids` is the full
+    submission order (responses are positional); ids missing from `by_id`
+    (already done, or gone from the jobs file) are skipped, not re-matched.
+    """
+    dest = getattr(bj, "dest", None)
+    responses = list(getattr(dest, "inlined_responses", None) or [])
+    results: list[dict] = []
+    total = sum(1 for jid in ids if jid in by_id)
+    for i, jid in enumerate(ids):
+        job = by_id.get(jid)
+        if job is None:
+            continue
+        if i >= len(responses):
+            rec = _result(job, "batch", started, error=f"batch {name} ended in {state} without a response")
+        else:
+            ir = responses[i]
+            resp = getattr(ir, "response", None)
+            err = getattr(ir, "error", None)
+            if err or resp is None:
+                rec = _result(job, "batch", started, error=str(err or "empty response"))
+            else:
+                u = getattr(resp, "usage_metadata", None)
+                usage = fill_usage(Usage(), u) if u else Usage()
+                rec = _result(job, "batch", started, getattr(resp, "text", "") or "", usage)
+        writer.write(rec)
+        results.append(rec)
+        _progress(rec, len(results), total)
+    return results
+
+def _collect_batches(pending: dict[str, list[str]], by_id: dict[str, Job], writer: ResultWriter,
+                     poll_s: float, started: float) -> list[dict]:
+    """
+    Polls every pending batch until all have finished, writing each batch's
+    results (and dropping it from the pending file) as soon as it completes.
+    """
+    client = get_client()
+    results: list[dict] = []
+    while pending:
+        for name, ids in list(pending.items()):
+            try:
+                bj = client.batches.get(name=name)
+            except Exception as e:
+                if is_transient(e):
+                    print(f"[batch] {name}: lookup failed ({e}), will retry", file=sys.stderr)
+                    continue
+                # unknown to the API (expired, other project, stale pending file): fail its jobs
+                print(f"[batch] {name}: lookup failed ({e}), dropping it", file=sys.stderr)
+                for jid in ids:
+                    if jid in by_id:
+                        rec = _result(by_id[jid], "batch", started, error=f"batch {name} lookup failed: {e!r}")
+                        writer.write(rec)
+                        results.append(rec)
+                pending.pop(name)
+                _save_pending(writer.path, pending)
+                continue
+            state = _state_name(getattr(bj, "state", None))
+            if state not in _BATCH_DONE:
+                print(f"[batch] {name}: {state or 'UNKNOWN'}", file=sys.stderr)
+                continue
+            results += _batch_results(name, bj, state, ids, by_id, writer, started)
+            pending.pop(name)
+            _save_pending(writer.path, pending)
+        if pending:
+            time.sleep(poll_s)
+    return results
+
+def run_batch(jobs: list[Job], writer: ResultWriter, uploads: UploadCache, poll_s: float) -> list[dict]:
+    """
+    Submit through the Gemini Batch API (one inline batch per model), then
+    poll all of them together. Submitted batch names are recorded next to the
+    output file so an interrupted run picks them up again instead of re-submitting.
+    """
+    client = get_client()
+    started = time.monotonic()
+    by_id = {j.id: j for j in jobs}
+    pending = _load_pending(writer.path)
+    results: list[dict] = []
+
+    # 1) jobs in batches submitted by a previous run are collected below, not re-submitted
+    resumed = {jid for ids in pending.values() for jid in ids}
+
+    # 2) submit the rest, grouped by model
+    groups: dict[str, list[Job]] = {}
+    for j in jobs:
+        if j.id not in resumed:
+            groups.setdefault(j.model, []).append(j)
+
+    for model, group in groups.items():
+        src, accepted = [], []
+        for j in group:
+            try:
+                src.append(_inline_request(j, [uploads.get(p) for p in j.attachments]))
+                accepted.append(j)
+            except Exception as e:
+                rec = _result(j, "batch", started, error=e)
+                writer.write(rec)
+                results.append(rec)
+        if not src:
+            continue
+        bj = client.batches.create(model=model, src=src,
+                                   config={"display_name": f"aurora-batch-{int(time.time())}"})
+        pending[bj.name] = [j.id for j in accepted]
+        _save_pending(writer.path, pending)
+        print(f"[batch] submitted {bj.name} ({len(src)} requests, {model})", file=sys.stderr)
+
+    # 3) wait for all batches (resumed and new) at once
+    results += _collect_batches(pending, by_id, writer, poll_s, started)
+
+    if not pending:
+        try:
+            os.remove(_pending_path(writer.path))
+        except OSError:
+            pass
+    return results
+
+
+# ---- Entry point ------------------------------------------------------------
+
+def _progress(rec: dict, n: int, total: int) -> None:
+    status = "ok" if rec["ok"] else f"ERR {rec['error']}"
+    print(f"[{n}/{total}] {rec['id']} ({rec['model']}, {rec['latency_s']}s): {status}", file=sys.stderr)
+
+def summarize(results: list[dict], uploads: UploadCache, elapsed: float) -> dict:
+    per_model: dict[str, dict] = {}
+    for r in results:
+        m = per_model.setdefault(r["model"], {"jobs": 0, "ok": 0, "input": 0, "output": 0,
+                                              "reasoning": 0, "total": 0})
+        m["jobs"] += 1
+        m["ok"] += int(bool(r["ok"]))
+        for k in ("input", "output", "reasoning", "total"):
+            m[k] += int(r["usage"].get(k) or 0)
+    return {
+        "jobs": len(results),
+        "ok": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "uploads": uploads.misses,
+        "uploads_deduped": uploads.hits,
+        "upload_bytes_saved": sum(r.saved_bytes for r in uploads.reports),
+        "upload_s": round(sum(r.upload_s for r in uploads.reports), 3),
+        "elapsed_s": round(elapsed, 3),
+        "usage_by_model": per_model,
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m backend.batch_cli",
+                                description="Run JSONL prompt jobs through the Gemini backend.")
+    p.add_argument("jobs", help="input JSONL file, one job per line")
+    p.add_argument("-o", "--output", required=True, help="results JSONL (also used as the resume checkpoint)")
+    p.add_argument("--model", default=DEFAULT_MODEL, help=f"default model for jobs without one ({DEFAULT_MODEL})")
+    p.add_argument("--workers", type=int, default=4, help="concurrent worker threads (default 4)")
+    p.add_argument("--rpm", type=float, default=60, help="shared request-per-minute cap, 0 = unlimited (default 60)")
+    p.add_argument("--stream", action="store_true", help="use stream_model instead of call_model")
+    p.add_argument("--batch", action="store_true", help="submit through the Gemini Batch API instead")
+    p.add_argument("--poll", type=float, default=30.0, help="batch status poll interval in seconds")
+    p.add_argument("--fresh", action="store_true", help="ignore existing results and start over")
+    p.add_argument("--summary", help="append the run summary (usage by model) to this JSONL file")
+    p.add_argument("--ledger", nargs="?", const="", default=None,
+                   help="also record usage in the local usage ledger (optional path, default $AURORA_LEDGER)")
+    p.add_argument("--fake", action="store_true", help="use the offline fake client (no API key needed)")
+    p.add_argument("--api-key", help="API key (defaults to GEMINI_API_KEY)")
+    return p
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.fake:
+        from backend.fake_client import FakeClient
+        set_client(FakeClient())
+    else:
+        get_client(api_key=args.api_key)
+
+    jobs = load_jobs(args.jobs, args.model)
+    done = set() if args.fresh else load_done(args.output)
+    todo = [j for j in jobs if j.id not in done]
+    print(f"{len(jobs)} job(s), {len(done & {j.id for j in jobs})} already done, {len(todo)} to run",
+          file=sys.stderr)
+
+    writer = ResultWriter(args.output, fresh=args.fresh)
+    if args.fresh:
+        try:
+            os.remove(_pending_path(args.output))
+        except OSError:
+            pass
+    uploads = UploadCache()
+    t0 = time.monotonic()
+    try:
+        if args.batch:
+            results = run_batch(todo, writer, uploads, args.poll)
+        else:
+            results = run_pool(todo, writer, args.workers, args.rpm, args.stream, uploads)
+    finally:
+        writer.close()
+
+    if args.ledger is not None:
+        from backend.usage_ledger import UsageLedger
+        ledger = UsageLedger(args.ledger or None)
+        session_id = f"batch:{os.path.basename(args.jobs)}"
+        for r in results:
+            if r["ok"]:
+                u = r["usage"]
+                ledger.record(session_id, r["model"],
+                              Usage(u["input"], u["output"], u["reasoning"], u["total"]), ts=r["ts"],
+                              mode="batch" if r["mode"] == "batch" else "interactive")
+
+    summary = summarize(results, uploads, time.monotonic() - t0)
+    summary["ts"] = time.time()
+    if args.summary:
+        with open(args.summary, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(summary) + "\n")
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# backend/fake_client.py
+from __future__ import annotations
+import hashlib
+import itertools
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Iterator
+
+# A tiny stand-in for genai.Client that never touches the network.
+# It mirrors only the surface used by genai_backend and the batch CLI:
+#   client.files.upload / client.files.get
+#   client.models.generate_content / client.models.generate_content_stream
+#   client.batches.create / client.batches.get
+
+
+def _count_tokens(text: str) -> int:
+    # Rough heuristic (~4 chars per token), good enough for offline runs.
+    return max(1, len(text) // 4) if text else 0
+
+def _contents_text(contents: Any) -> str:
+    """Flatten the mixed contents list (str / File / dict parts) into plain text."""
+    if isinstance(contents, str):
+        return contents
+    out: list[str] = []
+    for c in contents or []:
+        if isinstance(c, str):
+            out.append(c)
+        elif isinstance(c, dict):
+            for p in c.get("parts") or []:
+                if isinstance(p, dict) and p.get("text"):
+                    out.append(p["text"])
+    return "\n".join(out)
+
+def _contents_files(contents: Any) -> int:
+    if isinstance(contents, str):
+        return 0
+    n = 0
+    for c in contents or []:
+        if isinstance(c, dict):
+            n += sum(1 for p in c.get("parts") or [] if isinstance(p, dict) and p.get("file_data"))
+        elif not isinstance(c, str):
+            n += 1
+    return n
+
+def _usage(prompt_text: str, answer: str) -> SimpleNamespace:
+    p = _count_tokens(prompt_text)
+    r = _count_tokens(answer)
+    return SimpleNamespace(
+        prompt_token_count=p,
+        candidates_token_count=r,
+        thoughts_token_count=0,
+        total_token_count=p + r,
+    )
+
+def _answer(model: str, contents: Any) -> str:
+    text = _contents_text(contents)
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+    files = _contents_files(contents)
+    words = text.split()
+    tail = " ".join(words[-12:]) if words else ""
+    return f"[{model} fake {digest}] files={files} :: {tail}"
+
+
+class _FakeFiles:
+    def __init__(self, owner: "FakeClient"):
+        self._owner = owner
+        self._store: dict[str, SimpleNamespace] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def upload(self, *, file: Any, config: Any = None) -> SimpleNamespace:
+        self._owner._tick()
+        size = os.path.getsize(file) if isinstance(file, (str, os.PathLike)) else 0
+        with self._lock:
+            name = f"files/fake-{next(self._ids)}"
+            self._owner.upload_calls += 1
+        if isinstance(config, dict):
+            mime = config.get("mime_type")
+        else:
+            mime = getattr(config, "mime_type", None)
+        f = SimpleNamespace(
+            name=name,
+            uri=f"https://fake.invalid/{name}",
+            mime_type=mime or "application/octet-stream",
+            size_bytes=size,
+            state="ACTIVE",
+        )
+        with self._lock:
+            self._store[name] = f
+        return f
+
+    def get(self, name: str | None = None, **kw: Any) -> SimpleNamespace:
+        return self._store[name or kw["name"]]
+
+
+class _FakeModels:
+    def __init__(self, owner: "FakeClient"):
+        self._owner = owner
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        self._owner._tick()
+        if self._owner._take_call_failure():
+            from google.genai import errors
+            raise errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE",
+                                                     "message": "fake transient failure"}})
+        answer = _answer(model, contents)
+        return SimpleNamespace(text=answer, usage_metadata=_usage(_contents_text(contents), answer))
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None
+                                ) -> Iterator[SimpleNamespace]:
+        self._owner._tick()
+        answer = _answer(model, contents)
+        words = answer.split(" ")
+        fail_at = len(words) // 2 if self._owner._take_stream_failure() else -1
+        for i, w in enumerate(words):
+            if i == fail_at:
+                from google.genai import errors
+                raise errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE",
+                                                         "message": "fake mid-stream failure"}})
+            last = i == len(words) - 1
+            yield SimpleNamespace(
+                text=w + ("" if last else " "),
+                usage_metadata=_usage(_contents_text(contents), answer) if last else None,
+            )
+
+
+class _FakeBatches:
+    def __init__(self, owner: "FakeClient"):
+        self._owner = owner
+        self._jobs: dict[str, SimpleNamespace] = {}
+        self._ids = itertools.count(1)
+
+    def create(self, *, model: str, src: Any, config: Any = None) -> SimpleNamespace:
+        responses = []
+        for req in src or []:
+            contents = req.get("contents") if isinstance(req, dict) else None
+            answer = _answer(model, contents)
+            responses.append(SimpleNamespace(
+                response=SimpleNamespace(text=answer,
+                                         usage_metadata=_usage(_contents_text(contents), answer)),
+                error=None,
+            ))
+        name = f"batches/fake-{next(self._ids)}"
+        job = SimpleNamespace(
+            name=name,
+            model=model,
+            state=SimpleNamespace(name="JOB_STATE_SUCCEEDED"),
+            dest=SimpleNamespace(inlined_responses=responses),
+            error=None,
+        )
+        self._jobs[name] = job
+        return job
+
+    def get(self, name: str | None = None, **kw: Any) -> SimpleNamespace:
+        name = name or kw["name"]
+        if name not in self._jobs:
+            from google.genai import errors
+            raise errors.ClientError(404, {"error": {"code": 404, "status": "NOT_FOUND",
+                                                     "message": f"{name} not found"}})
+        return self._jobs[name]
+
+
+class FakeClient:
+    """
+    Offline replacement for genai.Client.
+    Answers are deterministic (derived from the prompt), usage is estimated
+    from character counts, and `latency` adds an artificial delay per call.
+    The first `fail_streams` streams raise a 503 halfway through, and the first
+    `fail_calls` non-streaming calls raise a 503, to exercise retries.
+    """
+    def __init__(self, latency: float = 0.0, fail_streams: int = 0, fail_calls: int = 0):
+        self.latency = latency
+        self.fail_streams = fail_streams
+        self.fail_calls = fail_calls
+        self.upload_calls = 0
+        self._lock = threading.Lock()
+        self.files = _FakeFiles(self)
+        self.models = _FakeModels(self)
+        self.batches = _FakeBatches(self)
+
+    def _tick(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _take_stream_failure(self) -> bool:
+        with self._lock:
+            if self.fail_streams > 0:
+                self.fail_streams -= 1
+                return True
+            return False
+
+    def _take_call_failure(self) -> bool:
+        with self._lock:
+            if self.fail_calls > 0:
+                self.fail_calls -= 1
+                return True
+            return False
@@ -1,38 +1,85 @@
 # backend/genai_backend.py
 from __future__ import annotations
 import os
+import queue
+import random
 import tempfile
+import threading
 import time
 from dataclasses import dataclass
-from typing import Iterable, Optional, Tuple, Any, Generator
+from typing import TYPE_CHECKING, Iterable, Optional, Sequence, Tuple, Any, Generator
 
-from google import genai
-from google.genai import types, errors
+# google.genai takes most of a second to import, so it is only imported
+# when the first client is built (or an SDK error type is needed).
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
 
 # ---- Public API -------------------------------------------------------------
 
 # Singleton-style client (lazy)
 _client: Optional[genai.Client] = None
+_client_lock = threading.Lock()   # compare mode may build the client from several threads
+_api_key: Optional[str] = None
+
+# Models offered in the UI (first one is the default)
+MODELS = (
+    "gemini-2.5-flash",
+    "gemini-2.5-pro",
+    "gemini-2.5-flash-preview-09-2025",
+    "gemini-2.0-flash",
+)
+
+# Seconds spent on the first `import google.genai` (None until it happens)
+SDK_IMPORT_S: Optional[float] = None
+
+def configure(api_key: str | None) -> None:
+    """
+    Remembers the API key for the lazily built client without importing the SDK.
+    Cheap enough to call on every Streamlit rerun.
+    """
+    global _api_key
+    _api_key = api_key or None
+
+def _import_genai():
+    global SDK_IMPORT_S
+    t0 = time.perf_counter()
+    from google import genai
+    if SDK_IMPORT_S is None:
+        SDK_IMPORT_S = time.perf_counter() - t0
+    return genai
 
 def get_client(api_key: str | None = None) -> genai.Client:
     """
     Returns a configured GenAI client (Gemini Developer API).
     Resolution order:
       1) explicit api_key argument,
-      2) GEMINI_API_KEY environment variable.
+      2) key passed to configure(),
+      3) GEMINI_API_KEY environment variable.
     """
     global _client
     if _client is not None:
         return _client
 
-    key = api_key or os.environ.get("GEMINI_API_KEY")
+    key = api_key or _api_key or os.environ.get("GEMINI_API_KEY")
     if not key:
         raise ValueError(
             "Missing API key. Set GEMINI_API_KEY in your environment (or pass api_key)."
         )
-    _client = genai.Client(api_key=key)
+    with _client_lock:
+        if _client is None:
+            genai = _import_genai()
+            _client = genai.Client(api_key=key)
     return _client
 
+def set_client(client: Any) -> None:
+    """
+    Installs a pre-built client as the shared singleton.
+    Handy for offline runs where a fake client stands in for genai.Client.
+    """
+    global _client
+    _client = client
+
 @dataclass
 class Usage:
     prompt: int = 0
@@ -54,6 +101,7 @@ def upload_bytes(name: str, b: bytes, mime_type: str | None = None) -> UploadedR
     polls briefly until the file is 'active' if the SDK exposes that state.
     """
     client = get_client()
+    from google.genai import errors
 
     # Keep extension so server can infer MIME
     _, ext = os.path.splitext(name)
@@ -67,7 +115,10 @@ def upload_bytes(name: str, b: bytes, mime_type: str | None = None) -> UploadedR
         last_err = None
         for attempt in range(1, 5):  # up to 4 tries
             try:
-                f = client.files.upload(file=tmp.name)  # path, not bytes/tuple
+                f = client.files.upload(  # path, not bytes/tuple
+                    file=tmp.name,
+                    config={"mime_type": mime_type} if mime_type else None,
+                )
                 break
             except errors.ServerError as e:
                 last_err = e
@@ -112,6 +163,39 @@ def build_contents(prompt: str, uploads: Iterable[UploadedRef] | None) -> list[A
             parts.append(u.file_obj)   # SDK accepts the File directly
     return parts
 
+def fill_usage(usage: Usage, u: Any) -> Usage:
+    """
+    Copies token counts from a response's usage_metadata onto `usage`.
+    Different SDKs / responses expose different names.
+    """
+    prompt  = (
+        getattr(u, "prompt_token_count", 0)
+        or getattr(u, "input_token_count", 0)
+        or getattr(u, "input_tokens", 0)
+        or 0
+    )
+    output  = (
+        getattr(u, "response_token_count", 0)
+        or getattr(u, "candidates_token_count", 0)
+        or getattr(u, "output_token_count", 0)
+        or getattr(u, "output_tokens", 0)
+        or 0
+    )
+    reasoning = (
+        getattr(u, "thoughts_token_count", 0)
+        or getattr(u, "reasoning_tokens", 0)
+        or 0
+    )
+    total = (
+        getattr(u, "total_token_count", 0)
+        or prompt + output + reasoning
+    )
+    usage.prompt = int(prompt or 0)
+    usage.response = int(output or 0)
+    usage.reasoning = int(reasoning or 0)
+    usage.total = int(total or 0)
+    return usage
+
 # The following currently not in sure, but can be used to replace the stream_model when streaming is not needed
 def call_model(model: str, prompt: str, uploads: Iterable[UploadedRef] | None = None) -> Tuple[str, Usage]:
     """
@@ -125,94 +209,225 @@ def call_model(model: str, prompt: str, uploads: Iterable[UploadedRef] | None =
 
     usage = Usage()
     if u:
-        # Different SDKs / responses expose different names.
-        prompt  = (
-            getattr(u, "prompt_token_count", 0)
-            or getattr(u, "input_token_count", 0)
-            or getattr(u, "input_tokens", 0)
-            or 0
-        )
-        output  = (
-            getattr(u, "response_token_count", 0)
-            or getattr(u, "candidates_token_count", 0)
-            or getattr(u, "output_token_count", 0)
-            or getattr(u, "output_tokens", 0)
-            or 0
-        )
-        reasoning = (
-            getattr(u, "thoughts_token_count", 0)
-            or getattr(u, "reasoning_tokens", 0)
-            or 0
-        )
-        total = (
-            getattr(u, "total_token_count", 0)
-            or prompt + output + reasoning
-        )
-        usage.prompt = int(prompt or 0)
-        usage.response = int(output or 0)
-        usage.reasoning = int(reasoning or 0)
-        usage.total = int(total or 0)
+        fill_usage(usage, u)
 
     return text, usage
 
-def stream_model(model: str, prompt: str, uploads: Iterable[UploadedRef] | None = None
-                 ) -> Generator[tuple[str, Any], None, None]:
+# ---- Stream retry ------------------------------------------------------------
+
+TRANSIENT_CODES = (429, 500, 502, 503, 504)
+
+@dataclass
+class RetryStats:
+    count: int = 0              # how many times the stream was re-opened
+    wait_s: float = 0.0         # time spent sleeping in backoff
+    added_latency_s: float = 0.0  # stall time the failures added (failure -> next new token)
+
+def is_transient(e: BaseException) -> bool:
+    """Rate limits, 5xx and dropped connections are worth retrying; anything else is not."""
+    from google.genai import errors
+    if isinstance(e, errors.APIError):
+        return getattr(e, "code", None) in TRANSIENT_CODES
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    # httpx transport errors (RemoteProtocolError, ReadError, ReadTimeout, ...)
+    name = e.__class__.__name__
+    return any(k in name for k in ("Protocol", "ReadError", "Timeout", "Connect"))
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    """
+    Seconds the server asked us to wait, from the Retry-After header
+    or a google.rpc.RetryInfo detail ("retryDelay": "13s").
+    """
+    headers = getattr(getattr(e, "response", None), "headers", None)
+    if headers:
+        v = headers.get("retry-after") or headers.get("Retry-After")
+        if v:
+            try:
+                return max(0.0, float(v))
+            except ValueError:
+                pass  # HTTP-date form; fall through to RetryInfo
+    details = getattr(e, "details", None)
+    if isinstance(details, dict):
+        for d in (details.get("error", details).get("details") or []):
+            delay = isinstance(d, dict) and d.get("retryDelay")
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return max(0.0, float(delay[:-1]))
+                except ValueError:
+                    pass
+    return None
+
+def _backoff(attempt: int, retry_after: Optional[float], base: float = 1.0, cap: float = 20.0) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, 0.5)
+    return delay
+
+def retry_delay(attempt: int, e: BaseException) -> float:
+    """Seconds to wait before retrying after transient error `e` on attempt `attempt` (0-based)."""
+    return _backoff(attempt, _retry_after(e))
+
+def _continuation_prompt(prompt: str, partial: str) -> str:
+    return (
+        prompt + partial
+        + "\n\n[Your previous reply was cut off right after the text above. "
+        "Continue it exactly from where it stopped. Do not repeat anything, do not add a preamble.]"
+    )
+
+MIN_OVERLAP = 8   # shorter repeats only count when they are whole words
+
+def _strip_overlap(partial: str, new: str, window: int = 200) -> str:
+    """
+    Drop the longest prefix of `new` that merely repeats the tail of `partial`.
+    Short overlaps must be whole words, so "He said hel" + "lo" stays "hello".
+    """
+    tail = partial[-window:]
+    for k in range(min(len(tail), len(new)), 0, -1):
+        if not tail.endswith(new[:k]):
+            continue
+        if k >= MIN_OVERLAP:
+            return new[k:]
+        start = len(partial) - k
+        starts_word = start == 0 or not partial[start - 1].isalnum()
+        ends_word = k < len(new) and not new[k].isalnum()
+        if starts_word and ends_word:
+            return new[k:]
+    return new
+
+def _event_text(event: Any) -> Optional[str]:
+    # Some SDK builds deliver partial text on .text, some via candidate parts.
+    txt = getattr(event, "text", None)
+    if not txt:
+        # fall back to parts aggregation if needed
+        try:
+            cands = getattr(event, "candidates", None)
+            if cands:
+                parts = getattr(cands[0].content, "parts", None) or []
+                txt = "".join(getattr(p, "text", "") for p in parts)
+        except Exception:
+            txt = None
+    return txt
+
+def _add_usage(total: Usage, part: Usage) -> None:
+    total.prompt += part.prompt
+    total.response += part.response
+    total.reasoning += part.reasoning
+    total.total += part.total
+
+def stream_model(model: str, prompt: str, uploads: Iterable[UploadedRef] | None = None,
+                 max_retries: int = 4) -> Generator[Any, None, None]:
     """
     Streaming generator.
-    Yields ('chunk', text_fragment) many times, then finally ('usage', Usage).
-    Falls back to non-streaming if stream is not supported by the SDK.
+    Yields text fragments many times, then finally
+    {'usage': Usage, 'retry': RetryStats, 'ttft_s': float | None, 'elapsed_s': float}.
+
+    Transient failures (429/5xx/dropped connection) are retried with jittered
+    backoff that honours Retry-After. If the stream dies mid-answer, the next
+    attempt asks the model to continue from the partial text, so the caller
+    sees one uninterrupted stream. Usage is summed over all attempts; when the
+    stream finally fails, the usage billed so far and the RetryStats are
+    attached to the exception as `exc.usage` and `exc.retry`.
     """
     client = get_client()
-    contents = build_contents(prompt, uploads)
+    uploads = list(uploads or [])
     usage = Usage()
+    stats = RetryStats()
+    t0 = time.perf_counter()
+    ttft: Optional[float] = None
+    partial = ""
+    stall_start: Optional[float] = None   # set while recovering from a failure
 
-    stream = client.models.generate_content_stream(model=model, contents=contents)
+    for attempt in range(max_retries + 1):
+        attempt_prompt = _continuation_prompt(prompt, partial) if partial else prompt
+        contents = build_contents(attempt_prompt, uploads)
+        attempt_usage = Usage()
+        fresh = True   # first text of a resumed attempt may repeat the tail
+        try:
+            stream = client.models.generate_content_stream(model=model, contents=contents)
+            for event in stream:
+                txt = _event_text(event)
+                if partial and fresh and attempt:
+                    fresh = False   # only the first resumed event can repeat the tail
+                    if txt:
+                        txt = _strip_overlap(partial, txt)
+                if txt:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    if stall_start is not None:
+                        stats.added_latency_s += time.monotonic() - stall_start
+                        stall_start = None
+                    partial += txt
+                    yield txt
 
-    for event in stream:
-        # Some SDK builds deliver partial text on .text, some via candidate parts.
-        txt = getattr(event, "text", None)
-        if not txt:
-            # fall back to parts aggregation if needed
-            try:
-                cands = getattr(event, "candidates", None)
-                if cands:
-                    parts = getattr(cands[0].content, "parts", None) or []
-                    txt = "".join(getattr(p, "text", "") for p in parts)
-            except Exception:
-                txt = None
-
-        if txt:
-            yield txt
-
-        um = getattr(event, "usage_metadata", None)
-        if um:
-            # Different SDKs / responses expose different names.
-            prompt  = (
-                getattr(um, "prompt_token_count", 0)
-                or getattr(um, "input_token_count", 0)
-                or getattr(um, "input_tokens", 0)
-                or 0
-            )
-            output  = (
-                getattr(um, "response_token_count", 0)
-                or getattr(um, "candidates_token_count", 0)
-                or getattr(um, "output_token_count", 0)
-                or getattr(um, "output_tokens", 0)
-                or 0
-            )
-            reasoning = (
-                getattr(um, "thoughts_token_count", 0)
-                or getattr(um, "reasoning_tokens", 0)
-                or 0
-            )
-            total = (
-                getattr(um, "total_token_count", 0)
-                or prompt + output + reasoning
-            )
-            usage.prompt = int(prompt or 0)
-            usage.response = int(output or 0)
-            usage.reasoning = int(reasoning or 0)
-            usage.total = int(total or 0)
+                um = getattr(event, "usage_metadata", None)
+                if um:
+                    fill_usage(attempt_usage, um)
+            _add_usage(usage, attempt_usage)
+            break
+        except Exception as e:
+            _add_usage(usage, attempt_usage)
+            if attempt >= max_retries or not is_transient(e):
+                if stall_start is not None:
+                    stats.added_latency_s += time.monotonic() - stall_start
+                e.usage = usage
+                e.retry = stats
+                raise
+            if stall_start is None:
+                stall_start = time.monotonic()
+            wait = retry_delay(attempt, e)
+            stats.count += 1
+            stats.wait_s += wait
+            time.sleep(wait)
+
+    if stall_start is not None:
+        stats.added_latency_s += time.monotonic() - stall_start
 
     # final signal with usage
-    yield {"usage": usage}
+    yield {"usage": usage, "retry": stats, "ttft_s": ttft, "elapsed_s": time.perf_counter() - t0}
+
+_DONE = object()
+
+def stream_models(models: Sequence[str], prompt: str, uploads: Iterable[UploadedRef] | None = None
+                  ) -> Generator[tuple[int, Any], None, None]:
+    """
+    Streams the same prompt (and the same uploaded refs) to several models at once.
+    Yields (index_into_models, event) as events arrive from any of them, where
+    event is what stream_model yields, or {'error': exc, 'usage': Usage | None}
+    if that model failed (usage is what it billed before failing).
+    Workers never touch Streamlit, so callers can render from their own thread.
+
+    Closing the generator early (the script was stopped or rerun) stops every
+    worker at its next event, so abandoned streams don't keep running.
+    """
+    uploads = list(uploads or [])
+    q: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def _worker(i: int, model: str) -> None:
+        gen = stream_model(model, prompt, uploads=uploads)
+        try:
+            for ev in gen:
+                if stop.is_set():
+                    break
+                q.put((i, ev))
+        except Exception as e:
+            q.put((i, {"error": e, "usage": getattr(e, "usage", None)}))
+        finally:
+            gen.close()
+            q.put((i, _DONE))
+
+    for i, m in enumerate(models):
+        threading.Thread(target=_worker, args=(i, m), name=f"stream-{m}", daemon=True).start()
+
+    remaining = len(models)
+    try:
+        while remaining:
+            i, ev = q.get()
+            if ev is _DONE:
+                remaining -= 1
+                continue
+            yield i, ev
+    finally:
+        stop.set()
@@ -0,0 +1,317 @@
+# backend/usage_ledger.py
+"""
+Local usage ledger: per-turn token counts priced from a rate table, pre-flight
+cost estimates, and per-session / per-day budgets.
+
+Turns are stored in a small SQLite file so several app sessions (and the batch
+CLI) can share it; aggregate with:
+
+    python -m backend.usage_ledger [--db PATH] [--days 7]
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+from backend.genai_backend import Usage
+from backend.ingest import wav_duration
+
+DEFAULT_DB = os.path.join(os.path.expanduser("~"), ".aurora", "usage.sqlite3")
+
+# USD per 1M tokens (standard tier, prompts <= 200k). Reasoning is billed as output.
+# Override or extend with a JSON file of the same shape (see load_rates).
+DEFAULT_RATES: dict[str, dict[str, float]] = {
+    "gemini-2.5-pro":                  {"input": 1.25, "output": 10.00},
+    "gemini-2.5-flash":                {"input": 0.30, "output": 2.50},
+    "gemini-2.5-flash-preview-09-2025": {"input": 0.30, "output": 2.50},
+    "gemini-2.0-flash":                {"input": 0.10, "output": 0.40},
+}
+
+# The Batch API bills inputs and outputs at half the interactive rate.
+BATCH_DISCOUNT = 0.5
+
+# Cheaper model to fall back to when a budget would be exceeded.
+DOWNGRADE: dict[str, str] = {
+    "gemini-2.5-pro": "gemini-2.5-flash",
+    "gemini-2.5-flash": "gemini-2.0-flash",
+    "gemini-2.5-flash-preview-09-2025": "gemini-2.0-flash",
+}
+
+def load_rates(path: str | None = None) -> dict[str, dict[str, float]]:
+    """
+    Returns the rate table: DEFAULT_RATES overlaid with the JSON file at `path`
+    (or $AURORA_RATES_FILE), e.g. {"gemini-2.5-pro": {"input": 1.25, "output": 10}}.
+    """
+    rates = {m: dict(r) for m, r in DEFAULT_RATES.items()}
+    path = path or os.environ.get("AURORA_RATES_FILE")
+    if path:
+        with open(os.path.expanduser(path), encoding="utf-8") as fh:
+            for model, r in json.load(fh).items():
+                rates.setdefault(model, {"input": 0.0, "output": 0.0}).update(
+                    {k: float(v) for k, v in r.items() if k in ("input", "output")}
+                )
+    return rates
+
+def price(model: str, input_tokens: int, output_tokens: int,
+          rates: dict[str, dict[str, float]] | None = None) -> float:
+    """USD cost of a call. Unknown models are priced at the most expensive known rate."""
+    rates = rates or DEFAULT_RATES
+    r = rates.get(model) or max(rates.values(), key=lambda x: x["output"])
+    return (input_tokens * r["input"] + output_tokens * r["output"]) / 1_000_000
+
+def usage_cost(model: str, usage: Usage, rates: dict[str, dict[str, float]] | None = None,
+               mode: str = "interactive") -> float:
+    """Cost of a call's usage; mode "batch" applies BATCH_DISCOUNT."""
+    cost = price(model, usage.prompt, usage.response + usage.reasoning, rates)
+    return cost * BATCH_DISCOUNT if mode == "batch" else cost
+
+
+# ---- Pre-flight estimates ---------------------------------------------------
+
+# Published per-modality token rates for Gemini inputs.
+TOKENS_PER_IMAGE = 258
+TOKENS_PER_PDF_PAGE = 258
+TOKENS_PER_AUDIO_SECOND = 32
+_AUDIO_BYTES_PER_SECOND = {          # fallback when the duration can't be read from a header
+    "audio/wav": 176_400,            # 44.1 kHz, 16-bit stereo PCM
+    "audio/mpeg": 16_000,            # ~128 kbps
+    "audio/mp4": 16_000,
+}
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+def estimate_text_tokens(text: str) -> int:
+    # ~4 characters per token for English prose
+    return (len(text) + 3) // 4
+
+def estimate_file_tokens(mime_type: str, size: int, data: bytes | None = None) -> int:
+    """
+    Rough input-token cost of one attachment from its MIME type and size.
+    PDFs are counted by page objects when the bytes are at hand.
+    """
+    mime = (mime_type or "").lower()
+    if mime.startswith("image/"):
+        return TOKENS_PER_IMAGE
+    if mime == "application/pdf":
+        pages = len(_PDF_PAGE_RE.findall(data)) if data else 0
+        if not pages:
+            pages = max(1, size // 60_000)
+        return pages * TOKENS_PER_PDF_PAGE
+    if mime.startswith("audio/"):
+        seconds = wav_duration(data) if data and mime == "audio/wav" else None
+        if seconds is None:
+            seconds = size / _AUDIO_BYTES_PER_SECOND.get(mime, 16_000)
+        return int(seconds * TOKENS_PER_AUDIO_SECOND) + 1
+    return (size + 3) // 4    # treat anything else as plain text
+
+@dataclass
+class Estimate:
+    input_tokens: int
+    output_tokens: int      # assumed reply length (not known before the call)
+    cost_usd: float
+
+def estimate_request(model: str, prompt: str, files: Iterable[tuple[str, int, Optional[bytes]]] = (),
+                     expected_output_tokens: int = 800,
+                     rates: dict[str, dict[str, float]] | None = None) -> Estimate:
+    """
+    Pre-flight estimate for a request: prompt text (history included) plus
+    attachments given as (mime_type, size_bytes, data_or_None) tuples.
+    """
+    tokens = estimate_text_tokens(prompt)
+    for mime, size, data in files:
+        tokens += estimate_file_tokens(mime, size, data)
+    return Estimate(
+        input_tokens=tokens,
+        output_tokens=expected_output_tokens,
+        cost_usd=price(model, tokens, expected_output_tokens, rates),
+    )
+
+
+# ---- Budgets ----------------------------------------------------------------
+
+@dataclass
+class Budget:
+    session_usd: Optional[float] = None     # None = unlimited
+    daily_usd: Optional[float] = None
+    on_exceed: str = "downgrade"            # "downgrade" or "block"
+
+    @classmethod
+    def from_env(cls, env: dict | None = None) -> "Budget":
+        """Reads AURORA_SESSION_BUDGET_USD / AURORA_DAILY_BUDGET_USD / AURORA_BUDGET_ACTION."""
+        env = os.environ if env is None else env
+        def _f(key: str) -> Optional[float]:
+            v = env.get(key)
+            return float(v) if v not in (None, "") else None
+        return cls(
+            session_usd=_f("AURORA_SESSION_BUDGET_USD"),
+            daily_usd=_f("AURORA_DAILY_BUDGET_USD"),
+            on_exceed=str(env.get("AURORA_BUDGET_ACTION") or "downgrade").lower(),
+        )
+
+class BudgetExceeded(RuntimeError):
+    """Raised by callers when a pre-flight check blocks a request."""
+
+@dataclass
+class Decision:
+    action: str             # "allow" | "downgrade" | "block"
+    model: str              # model to actually use
+    estimate: Estimate
+    reason: str = ""
+
+
+# ---- Ledger -----------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    ts          REAL NOT NULL,
+    day         TEXT NOT NULL,
+    session_id  TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    input       INTEGER NOT NULL,
+    output      INTEGER NOT NULL,
+    reasoning   INTEGER NOT NULL,
+    total       INTEGER NOT NULL,
+    cost_usd    REAL NOT NULL,
+    est_cost_usd REAL
+);
+CREATE INDEX IF NOT EXISTS turns_day ON turns(day);
+CREATE INDEX IF NOT EXISTS turns_session ON turns(session_id);
+"""
+
+def _today(ts: float | None = None) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+class UsageLedger:
+    """
+    Append-only record of priced turns, shared by every session on this machine.
+    Connections are opened per call so the ledger is safe to use from any thread.
+    """
+    def __init__(self, path: str | None = None, rates: dict[str, dict[str, float]] | None = None):
+        self.path = path or os.environ.get("AURORA_LEDGER") or DEFAULT_DB
+        if self.path != ":memory:":
+            self.path = os.path.expanduser(self.path)   # "~/.aurora/usage.sqlite3" from env / secrets
+        self.rates = rates or load_rates()
+        self._lock = threading.Lock()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._mem = sqlite3.connect(":memory:", check_same_thread=False) if self.path == ":memory:" else None
+        with self._connect() as con:
+            con.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        con = self._mem or sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with con:   # commit / rollback
+                yield con
+        finally:
+            if con is not self._mem:
+                con.close()
+
+    def record(self, session_id: str, model: str, usage: Usage,
+               estimate: Estimate | None = None, ts: float | None = None,
+               mode: str = "interactive") -> float:
+        """Stores one turn and returns its cost in USD ("batch" turns at the Batch API rate)."""
+        ts = ts or time.time()
+        cost = usage_cost(model, usage, self.rates, mode)
+        with self._lock, self._connect() as con:
+            con.execute(
+                "INSERT INTO turns VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (ts, _today(ts), session_id, model, usage.prompt, usage.response,
+                 usage.reasoning, usage.total, cost, estimate.cost_usd if estimate else None),
+            )
+        return cost
+
+    def spent(self, session_id: str | None = None, day: str | None = None) -> float:
+        where, args = [], []
+        if session_id:
+            where.append("session_id = ?"); args.append(session_id)
+        if day:
+            where.append("day = ?"); args.append(day)
+        sql = "SELECT COALESCE(SUM(cost_usd), 0) FROM turns"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._connect() as con:
+            return float(con.execute(sql, args).fetchone()[0])
+
+    def summary(self, since_day: str | None = None, session_id: str | None = None) -> list[dict]:
+        """Per day and model: turns, tokens and cost."""
+        where, args = [], []
+        if since_day:
+            where.append("day >= ?"); args.append(since_day)
+        if session_id:
+            where.append("session_id = ?"); args.append(session_id)
+        sql = ("SELECT day, model, COUNT(*), SUM(input), SUM(output), SUM(reasoning), SUM(total), "
+               "SUM(cost_usd), COUNT(DISTINCT session_id) FROM turns")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY day, model ORDER BY day, model"
+        keys = ("day", "model", "turns", "input", "output", "reasoning", "total", "cost_usd", "sessions")
+        with self._connect() as con:
+            return [dict(zip(keys, row)) for row in con.execute(sql, args)]
+
+    def check(self, session_id: str, model: str, estimate: Estimate, budget: Budget) -> Decision:
+        """
+        Pre-flight budget check. If the estimated cost would push the session or
+        today's spend over budget, either walk down the DOWNGRADE chain until a
+        model fits, or block the request.
+        """
+        session_left = (budget.session_usd - self.spent(session_id=session_id)
+                        if budget.session_usd is not None else None)
+        day_left = (budget.daily_usd - self.spent(day=_today())
+                    if budget.daily_usd is not None else None)
+
+        def _fits(est: Estimate) -> bool:
+            return all(left is None or est.cost_usd <= left for left in (session_left, day_left))
+
+        if _fits(estimate):
+            return Decision("allow", model, estimate)
+
+        which = "session" if session_left is not None and estimate.cost_usd > session_left else "daily"
+        reason = f"{which} budget would be exceeded (estimated ${estimate.cost_usd:.4f})"
+        if budget.on_exceed == "downgrade":
+            cand = DOWNGRADE.get(model)
+            while cand:
+                est = _reprice(estimate, cand, self.rates)
+                if _fits(est):
+                    return Decision("downgrade", cand, est, f"{reason}; using {cand}")
+                cand = DOWNGRADE.get(cand)
+        return Decision("block", model, estimate, reason)
+
+def _reprice(estimate: Estimate, model: str, rates: dict[str, dict[str, float]]) -> Estimate:
+    return Estimate(estimate.input_tokens, estimate.output_tokens,
+                    price(model, estimate.input_tokens, estimate.output_tokens, rates))
+
+
+# ---- Report -----------------------------------------------------------------
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(prog="python -m backend.usage_ledger",
+                                description="Aggregate the local usage ledger by day and model.")
+    p.add_argument("--db", help=f"ledger path (default $AURORA_LEDGER or {DEFAULT_DB})")
+    p.add_argument("--days", type=int, default=7, help="how many days back to include (default 7)")
+    p.add_argument("--json", action="store_true", help="print rows as JSON lines")
+    args = p.parse_args(argv)
+
+    ledger = UsageLedger(args.db)
+    since = _today(time.time() - max(0, args.days - 1) * 86400)
+    rows = ledger.summary(since_day=since)
+    if args.json:
+        for r in rows:
+            print(json.dumps(r))
+        return 0
+    print(f"{'day':<11}{'model':<34}{'turns':>6}{'input':>10}{'output':>10}{'reason':>9}{'USD':>10}")
+    for r in rows:
+        print(f"{r['day']:<11}{r['model']:<34}{r['turns']:>6}{r['input']:>10}{r['output']:>10}"
+              f"{r['reasoning']:>9}{r['cost_usd']:>10.4f}")
+    print(f"total: ${sum(r['cost_usd'] for r in rows):.4f} over {len(rows)} row(s)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
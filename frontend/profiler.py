@@ -0,0 +1,209 @@
+# frontend/profiler.py
+"""
+Opt-in rerun profiler for app.py.
+
+Turn it on with ?profile=1 (named sections) or ?profile=sample (sections plus a
+stack-sampling profiler), or the AURORA_PROFILE secret / env var with the same
+values.
+
+- Top-level sections are the laps between timing marks ("setup", "header",
+  "timeline", "composer"); work after the last mark reached shows up as
+  "after-<mark>". Hot spots inside them use `with prof.section(name):`.
+- Inclusive times are aggregated per browser session for the debug panel.
+- Each run appends collapsed stacks ("rerun;composer;thumbnails 1234", in µs of
+  self time) to <dir>/<session>.sections.folded. Sampled stacks go to
+  <dir>/<session>.samples.folded. Both load directly in flamegraph.pl,
+  speedscope or inferno.
+"""
+from __future__ import annotations
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Iterator, Optional
+
+DEFAULT_DIR = ".aurora_profile"
+_NULL = contextlib.nullcontext()
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples one thread's Python stack every `interval` seconds.
+    Frames above the first frame from `root_file` (Streamlit's script runner)
+    are dropped, and samples taken while the script is idle are skipped.
+    """
+    def __init__(self, thread_id: int, root_file: str, interval: float = 0.005):
+        super().__init__(name="aurora-stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.root_file = os.path.abspath(root_file)
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: list[str] = []
+            while frame is not None:
+                co = frame.f_code
+                stack.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+                if os.path.abspath(co.co_filename) == self.root_file and co.co_name == "<module>":
+                    break
+                frame = frame.f_back
+            else:
+                continue   # not inside the app script right now
+            self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._halt.set()
+        self.join(timeout=1.0)
+        return self.counts
+
+
+class RerunProfiler:
+    """Per-run section timer. When disabled every method is a cheap no-op."""
+    def __init__(self, enabled: bool = False, sample: bool = False, out_dir: str | None = None,
+                 session_id: str = "session", stats: dict | None = None, root_file: str | None = None,
+                 t0: float | None = None):
+        self.enabled = enabled
+        self.out_dir = out_dir or DEFAULT_DIR
+        self.session_id = session_id
+        self.stats = stats if stats is not None else {}
+        self.t0 = t0 if t0 is not None else time.perf_counter()   # same origin as the RerunTimer
+        self._lap_start = 0.0
+        self._open: list[str] = []                       # nested section names
+        self._children: list[tuple[str, float]] = []     # finished sections in the current lap
+        self._folded: list[tuple[str, float]] = []       # (stack, self seconds)
+        self._last_exit = 0.0                            # run-relative end of the latest section
+        self._last_label = "start"
+        self.sampler: Optional[StackSampler] = None
+        if enabled and sample and root_file:
+            self.sampler = StackSampler(threading.get_ident(), root_file)
+            self.sampler.start()
+
+    @classmethod
+    def start(cls, mode: str | None, ss, out_dir: str | None = None, root_file: str | None = None,
+              t0: float | None = None) -> "RerunProfiler":
+        """
+        Builds this run's profiler from the toggle value ("1"/"on"/"sample"),
+        flushing whatever the previous run left unflushed (e.g. after st.rerun()).
+        """
+        prev = ss.get("_profiler")
+        if prev is not None:
+            prev.flush()
+        mode = str(mode or "").strip().lower()
+        enabled = mode in ("1", "true", "on", "yes", "sections", "sample")
+        prof = cls(
+            enabled=enabled,
+            sample=(mode == "sample"),
+            out_dir=out_dir,
+            session_id=str(ss.get("session_id") or "session"),
+            stats=ss.setdefault("profile_stats", {}) if enabled else None,
+            root_file=root_file,
+            t0=t0,
+        )
+        ss["_profiler"] = prof if enabled else None
+        return prof
+
+    # ---- recording ----------------------------------------------------------
+
+    def _record(self, path: str, seconds: float) -> None:
+        s = self.stats.setdefault(path, {"runs": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+        s["runs"] += 1
+        s["total_s"] += seconds
+        s["max_s"] = max(s["max_s"], seconds)
+        s["last_s"] = seconds
+
+    @contextlib.contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        self._open.append(name)
+        path = ";".join(self._open)
+        start = len(self._children)
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            dt = end - t
+            self._last_exit = end - self.t0
+            self._open.pop()
+            nested = sum(d for p, d in self._children[start:] if p.count(";") == path.count(";") + 1)
+            self._children.append((path, dt))
+            self._folded.append((path, max(0.0, dt - nested)))
+            self._record(path, dt)
+
+    def section(self, name: str):
+        """Context manager timing a named block (nested sections are allowed)."""
+        return self._timed(name) if self.enabled else _NULL
+
+    def lap(self, label: str, at: float) -> None:
+        """
+        Closes the top-level section that ran since the previous lap;
+        `at` is seconds since the run started (as recorded by timing.RerunTimer).
+        """
+        if not self.enabled:
+            return
+        dt = at - self._lap_start
+        self._lap_start = at
+        self._last_exit = at
+        self._last_label = label
+        self._close_lap(label, dt)
+
+    def _close_lap(self, label: str, dt: float) -> None:
+        top = sum(d for p, d in self._children if ";" not in p)
+        self._folded = [
+            (f"rerun;{label};{p}", d) if not p.startswith("rerun;") else (p, d) for p, d in self._folded
+        ]
+        self._folded.append((f"rerun;{label}", max(0.0, dt - top)))
+        self._children = []
+        self._record(label, dt)
+
+    # ---- output -------------------------------------------------------------
+
+    def flush(self) -> None:
+        """
+        Appends the stacks recorded so far to the folded files and stops the
+        sampler. Can be called again; later sections are written on the next call.
+        """
+        if not self.enabled:
+            return
+        if self._children:
+            # sections that finished after the last mark (send handler, streaming turn)
+            self._close_lap(f"after-{self._last_label}", self._last_exit - self._lap_start)
+            self._lap_start = self._last_exit
+        samples = None
+        if self.sampler is not None and self.sampler.is_alive():
+            samples = self.sampler.stop()
+        folded, self._folded = self._folded, []
+        if not folded and not samples:
+            return
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(os.path.join(self.out_dir, f"{self.session_id}.sections.folded"), "a",
+                      encoding="utf-8") as fh:
+                for stack, secs in folded:
+                    us = int(secs * 1e6)
+                    if us > 0:
+                        fh.write(f"{stack} {us}\n")
+            if samples:
+                with open(os.path.join(self.out_dir, f"{self.session_id}.samples.folded"), "a",
+                          encoding="utf-8") as fh:
+                    for stack, n in samples.items():
+                        fh.write(f"{stack} {n}\n")
+        except OSError:
+            pass   # profiling must never break the app
+
+    def table(self) -> list[dict]:
+        """Aggregated rows for the debug panel, slowest mean first."""
+        rows = []
+        for path, s in self.stats.items():
+            rows.append({
+                "section": path,
+                "runs": s["runs"],
+                "mean_ms": round(s["total_s"] / s["runs"] * 1000, 2),
+                "max_ms": round(s["max_s"] * 1000, 2),
+                "last_ms": round(s["last_s"] * 1000, 2),
+            })
+        return sorted(rows, key=lambda r: r["mean_ms"], reverse=True)
@@ -0,0 +1,126 @@
+# frontend/styles.py
+# Global CSS for app.py. Kept in a module so it is built once per process,
+# not re-parsed with the script on every rerun.
+
+CSS = """
+<style>
+header[data-testid="stHeader"] { display: none !important; }
+
+.stApp {
+  background:
+    radial-gradient(1200px 800px at 18% 12%, rgba(99,102,241,0.24), transparent 40%),
+    radial-gradient(1100px 750px at 82% 18%, rgba(255,215,0,0.20), transparent 46%),
+    radial-gradient(950px 650px at 46% 78%, rgba(236,72,153,0.22), transparent 52%),
+    linear-gradient(180deg, #0b0f16 0%, #0a0e14 60%, #0a0e14 100%);
+}
+
+.block-container {
+  padding-top: 0px;
+  padding-bottom: 15px;
+  padding-left: 20px;
+  padding-right: 20px;
+  max-width: 1500px;
+}
+
+.header-row { margin-top: .25rem; }
+.model-box .stSelectbox, .model-box .stSelectbox > div, .model-box div[data-baseweb="select"] {
+  min-width: 260px !important;
+  max-width: 260px !important;
+}
+.header-right { display:flex; justify-content:flex-end; align-items:center; }
+
+.brand {
+  font-weight: 800; font-size: 40px; letter-spacing: .3px;
+  background: linear-gradient(90deg, #7c3aed 0%, #f59e0b 100%);
+  -webkit-background-clip: text; -webkit-text-fill-color: transparent;
+  display: flex; justify-content: center; align-items: center;
+  height: 100px;
+}
+
+/* Fixed composer (single definition) */
+.composer-shell{
+  position: fixed; left:0; right:0; bottom:0; z-index:3000; transform: translateZ(0);
+  background: linear-gradient(180deg, rgba(10,14,20,0.00) 0%, rgba(10,14,20,0.72) 35%, rgba(10,14,20,0.96) 100%);
+  padding: 10px 0 calc(env(safe-area-inset-bottom,0) + 10px);
+}
+.composer-inner{ max-width: min(1200px, 96vw); width: 100%; margin: 0 auto; }
+
+.composer-inner > div[data-testid="stAppViewContainer"] > .st-emotion-cache-1jicfl2 {
+  background:rgba(255,255,255,0.04) !important;
+  border:1px solid rgba(255,255,255,0.10) !important;
+  border-radius: 16px !important;
+}
+
+/* Row: ＋ | input | Send */
+.plus-btn button { width: 46px; height: 46px; border-radius: 12px; padding: 0; }
+.badge{ display:inline-flex; align-items:center; justify-content:center;
+  min-width:18px; height:18px; padding:0 4px; font-size:11px; border-radius:999px;
+  background:#ef4444; color:#fff; margin-left:6px; }
+
+.composer-input [data-testid="stTextInput"] > div { width: 100% !important; }
+.composer-input input[type="text"]{
+  width: 100% !important;
+  height: 46px !important;
+  line-height: 46px !important;
+  border-radius: 12px; padding: 0 12px; font-size: 16px;
+}
+
+/* Send button */
+.send-btn button{
+  height: 46px !important; border-radius: 999px; border: none;
+  background: linear-gradient(90deg, #7c3aed 0%, #f59e0b 100%);
+  color: white; font-weight: 600;
+}
+.send-btn button:hover{ filter: brightness(1.05); }
+
+/* Pre-send preview area */
+.staged-preview {
+  margin-top: 8px; display: flex; gap: 8px; flex-wrap: wrap;
+}
+.staged-pill {
+  background: rgba(255,255,255,0.06); border:1px solid rgba(255,255,255,0.12);
+  border-radius: 12px; padding: 6px 10px; font-size: 13px;
+}
+
+/* small preview bar for attached files (shows in composer before send) */
+.preview-bar {
+  display: flex; gap: 8px; align-items: center; flex-wrap: wrap;
+  margin-bottom: 6px;
+}
+.preview-pill {
+  display:inline-flex; align-items:center; gap:8px;
+  padding: 6px 10px; border-radius: 999px;
+  background: rgba(255,255,255,0.06);
+  border:1px solid rgba(255,255,255,0.10);
+  font-size: 13px;
+}
+.preview-thumb { width: 24px; height: 24px; object-fit: cover; border-radius: 6px; }
+
+/* floating scroll-to-bottom button */
+.scroll-down-btn{
+  position: fixed; right: 18px; bottom: 86px;
+  z-index: 9999;                       /* above composer */
+  border: 0; border-radius: 999px; padding: 10px 12px;
+  background: linear-gradient(90deg, #7c3aed 0%, #f59e0b 100%);
+  color: #fff; font-weight: 700; box-shadow: 0 6px 18px rgba(0,0,0,.35);
+  cursor: pointer;
+  opacity: 1; transform: scale(1); transition: opacity .18s, transform .18s;
+  pointer-events: auto;
+}
+.scroll-down-btn.hidden{
+  opacity: 0; transform: scale(.96); pointer-events: none;
+}
+.scroll-down-btn:hover{ filter:brightness(1.05); }
+
+/* thinking loader: three pulsing dots */
+@keyframes blink { 0%{opacity:.2} 20%{opacity:1} 100%{opacity:.2} }
+.dot { animation: blink 1.4s infinite both; }
+.dot:nth-child(2){ animation-delay: .2s; }
+.dot:nth-child(3){ animation-delay: .4s; }
+
+.hero-inner {
+  text-align: center;
+}
+
+</style>
+"""
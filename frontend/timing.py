@@ -0,0 +1,91 @@
+# frontend/timing.py
+"""
+Startup / rerun timing for app.py.
+
+Module state lives for the whole server process (Streamlit imports this once),
+so the first script run after start-up is reported as the cold run and every
+later run as a steady-state rerun. The cold run is measured from the top of
+app.py, so it covers our own imports and per-process setup but not Streamlit's
+server start. The SDK is imported later, on the first model call; report()
+adds that cost to the cold run as `cold_start_s`. Set AURORA_TIMING_LOG to a
+path to append one JSON line per run, e.g. to compare two versions of the app.
+"""
+from __future__ import annotations
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+_lock = threading.Lock()
+_cold: Optional[dict] = None
+_warm: deque = deque(maxlen=200)   # recent steady-state runs
+
+
+class RerunTimer:
+    """Checkpoints for one script run: mark() after each block, finish() at the end."""
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.marks: list[tuple[str, float]] = []
+        self.done = False
+        self.profiler = None    # frontend.profiler.RerunProfiler; gets each mark as a lap
+
+    def mark(self, label: str) -> None:
+        t = time.perf_counter() - self.t0
+        self.marks.append((label, t))
+        if self.profiler is not None:
+            self.profiler.lap(label, t)
+
+    def finish(self) -> dict:
+        """Records the run (once) and returns it."""
+        global _cold
+        total = time.perf_counter() - self.t0
+        rec = {
+            "ts": time.time(),
+            "total_s": round(total, 4),
+            "marks": {label: round(t, 4) for label, t in self.marks},
+        }
+        if self.done:
+            return rec
+        self.done = True
+        with _lock:
+            if _cold is None:
+                rec["kind"] = "cold"
+                _cold = rec
+            else:
+                rec["kind"] = "rerun"
+                _warm.append(rec)
+        path = os.environ.get("AURORA_TIMING_LOG")
+        if path:
+            try:
+                with open(path, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(rec) + "\n")
+            except OSError:
+                pass
+        return rec
+
+def start_rerun() -> RerunTimer:
+    return RerunTimer()
+
+def report() -> dict:
+    """
+    Cold run, first-call SDK import, and median / p90 / max of recent reruns
+    (seconds). cold_start_s = cold run + SDK import, i.e. what the first user
+    waits for between opening the page and the first token request going out.
+    """
+    from backend import genai_backend
+    with _lock:
+        warm = [r["total_s"] for r in _warm]
+        cold = dict(_cold) if _cold else None
+    sdk = genai_backend.SDK_IMPORT_S
+    out: dict = {"cold": cold, "reruns": len(warm), "sdk_import_s": sdk}
+    if cold:
+        out["cold_start_s"] = round(cold["total_s"] + (sdk or 0.0), 4)
+    if warm:
+        q = sorted(warm)
+        out["rerun_median_s"] = round(statistics.median(q), 4)
+        out["rerun_p90_s"] = round(q[min(len(q) - 1, int(len(q) * 0.9))], 4)
+        out["rerun_max_s"] = q[-1]
+    return out
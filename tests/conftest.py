@@ -0,0 +1,20 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# backend/ and frontend/ are namespace packages next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import genai_backend
+from backend.fake_client import FakeClient
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """Installs an offline FakeClient as the shared client; backoff sleeps are skipped."""
+    client = FakeClient()
+    monkeypatch.setattr(genai_backend, "_client", client)
+    monkeypatch.setattr(genai_backend, "_backoff", lambda *a, **k: 0.0)
+    return client
@@ -0,0 +1,138 @@
+# tests/test_batch_cli.py
+import json
+import time
+
+from backend import batch_cli
+from backend.batch_cli import RateLimiter, ResultWriter, UploadCache, load_done, load_jobs, run_batch
+
+
+def _write_jobs(tmp_path, *jobs):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text("".join(json.dumps(j) + "\n" for j in jobs), encoding="utf-8")
+    return str(path)
+
+def _results(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rpm=600)   # one slot every 0.1 s
+    t0 = time.monotonic()
+    for _ in range(4):
+        limiter.wait()
+    assert time.monotonic() - t0 >= 0.29
+
+def test_rate_limiter_disabled():
+    limiter = RateLimiter(rpm=0)
+    t0 = time.monotonic()
+    for _ in range(100):
+        limiter.wait()
+    assert time.monotonic() - t0 < 0.05
+
+def test_upload_cache_dedupes_by_content(fake_client, tmp_path):
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    c = tmp_path / "c.txt"
+    a.write_bytes(b"same bytes")
+    b.write_bytes(b"same bytes")
+    c.write_bytes(b"other bytes")
+    cache = UploadCache()
+    refs = [cache.get(str(p)) for p in (a, b, c, a)]
+    assert refs[0] is refs[1] is refs[3]
+    assert refs[2] is not refs[0]
+    assert (cache.misses, cache.hits) == (2, 2)
+    assert fake_client.upload_calls == 2
+
+def test_load_done_skips_failures_and_torn_lines(tmp_path):
+    out = tmp_path / "out.jsonl"
+    out.write_text(
+        json.dumps({"id": "a", "ok": True}) + "\n"
+        + json.dumps({"id": "b", "ok": False}) + "\n"
+        + '{"id": "c", "ok": tr',                       # crash mid-write
+        encoding="utf-8",
+    )
+    assert load_done(str(out)) == {"a"}
+    assert load_done(str(tmp_path / "missing.jsonl")) == set()
+
+def test_pool_run_resumes_from_checkpoint(fake_client, tmp_path):
+    jobs = _write_jobs(tmp_path, {"id": "a", "prompt": "alpha"}, {"id": "b", "prompt": "beta"})
+    out = str(tmp_path / "out.jsonl")
+    with open(out, "w", encoding="utf-8") as fh:
+        fh.write(json.dumps({"id": "a", "ok": True, "text": "earlier"}) + "\n")
+
+    assert batch_cli.main([jobs, "-o", out, "--rpm", "0"]) == 0
+    recs = _results(out)
+    assert [r["id"] for r in recs] == ["a", "b"]
+    assert "beta" in recs[1]["text"]
+
+def test_batch_resume_matches_responses_by_position(fake_client, tmp_path):
+    jobs_path = _write_jobs(tmp_path, {"id": "a", "prompt": "alpha question"},
+                            {"id": "b", "prompt": "beta question"})
+    out = str(tmp_path / "out.jsonl")
+    # a previous run submitted [a, b] and wrote a's result before stopping
+    jobs = load_jobs(jobs_path, "gemini-2.5-flash")
+    bj = fake_client.batches.create(model="gemini-2.5-flash",
+                                    src=[batch_cli._inline_request(j, []) for j in jobs])
+    batch_cli._save_pending(out, {bj.name: ["a", "b"]})
+    with open(out, "w", encoding="utf-8") as fh:
+        fh.write(json.dumps({"id": "a", "ok": True}) + "\n")
+
+    done = load_done(out)
+    writer = ResultWriter(out)
+    try:
+        results = run_batch([j for j in jobs if j.id not in done], writer, UploadCache(), poll_s=0.0)
+    finally:
+        writer.close()
+    assert [r["id"] for r in results] == ["b"]
+    assert "beta question" in results[0]["text"]
+
+def test_batch_unknown_pending_name_fails_its_jobs(fake_client, tmp_path):
+    jobs_path = _write_jobs(tmp_path, {"id": "a", "prompt": "alpha"},
+                            {"id": "b", "prompt": "beta", "model": "gemini-2.5-pro"})
+    out = str(tmp_path / "out.jsonl")
+    batch_cli._save_pending(out, {"batches/gone": ["a"]})
+
+    assert batch_cli.main([jobs_path, "-o", out, "--batch", "--fake", "--poll", "0"]) == 1
+    by_id = {r["id"]: r for r in _results(out)}
+    assert not by_id["a"]["ok"] and "batches/gone" in by_id["a"]["error"]
+    assert by_id["b"]["ok"]
+    assert batch_cli._load_pending(out) == {}
+
+class _CountingLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__(rpm=0)
+        self.calls = 0
+
+    def wait(self) -> None:
+        self.calls += 1
+
+def test_sync_job_retries_transient_errors_under_the_limiter(fake_client):
+    fake_client.fail_calls = 2
+    limiter = _CountingLimiter()
+    rec = batch_cli.run_job(batch_cli.Job("a", "alpha", "gemini-2.5-flash"), UploadCache(), limiter, stream=False)
+    assert rec["ok"] and rec["retries"] == 2
+    assert limiter.calls == 3
+
+def test_sync_job_gives_up_after_max_retries(fake_client):
+    fake_client.fail_calls = batch_cli.MAX_RETRIES + 1
+    rec = batch_cli.run_job(batch_cli.Job("a", "alpha", "gemini-2.5-flash"), UploadCache(),
+                            _CountingLimiter(), stream=False)
+    assert not rec["ok"] and "ServerError" in rec["error"]
+
+def test_ledger_prices_batch_results_at_batch_rate(tmp_path):
+    from backend.genai_backend import Usage
+    from backend.usage_ledger import BATCH_DISCOUNT, UsageLedger, usage_cost
+    jobs = _write_jobs(tmp_path, {"id": "a", "prompt": "alpha " * 200})
+    db = str(tmp_path / "ledger.sqlite3")
+    for mode, out in (("--batch", "b.jsonl"), ("--stream", "s.jsonl")):
+        assert batch_cli.main([jobs, "-o", str(tmp_path / out), "--fake", mode, "--poll", "0",
+                               "--rpm", "0", "--ledger", db]) == 0
+    b, = _results(tmp_path / "b.jsonl")
+    s, = _results(tmp_path / "s.jsonl")
+    def cost(r):
+        u = r["usage"]
+        return usage_cost(r["model"], Usage(u["input"], u["output"], u["reasoning"], u["total"]))
+    expected = cost(b) * BATCH_DISCOUNT + cost(s)
+    assert abs(UsageLedger(db).spent() - expected) < 1e-12
+    assert cost(b) > 0
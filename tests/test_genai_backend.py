@@ -0,0 +1,104 @@
+# tests/test_genai_backend.py
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors
+
+from backend.genai_backend import _retry_after, _strip_overlap, stream_model, stream_models
+
+
+def _scripted(fake_client, *attempts):
+    """
+    Replaces the fake stream with scripted attempts: each is a list of text
+    chunks, and every attempt except the last dies with a 503 after its chunks.
+    """
+    calls = iter(attempts)
+    def stream(*, model, contents, config=None):
+        chunks = next(calls)
+        for c in chunks:
+            yield SimpleNamespace(text=c, usage_metadata=None)
+        if chunks is not attempts[-1]:
+            raise errors.ServerError(503, {"error": {"code": 503, "message": "dropped"}})
+    fake_client.models.generate_content_stream = stream
+
+def _collect(gen):
+    text, final = "", None
+    for ev in gen:
+        if isinstance(ev, dict):
+            final = ev
+        else:
+            text += ev
+    return text, final
+
+
+def test_strip_overlap():
+    assert _strip_overlap("The quick brown", "brown fox") == " fox"
+    assert _strip_overlap("The quick brown", " fox") == " fox"
+    assert _strip_overlap("", "fox") == "fox"
+    assert _strip_overlap("He said hello", "said hello world") == " world"
+
+def test_strip_overlap_keeps_short_non_word_repeats():
+    assert _strip_overlap("He said hel", "lo world") == "lo world"
+    assert _strip_overlap("a cool", "ol breeze") == "ol breeze"
+    assert _strip_overlap("I said no", " no way") == " no way"
+    assert _strip_overlap("I said no", "no, way") == ", way"
+
+def test_retry_after_header_and_retry_info():
+    hdr = SimpleNamespace(response=SimpleNamespace(headers={"retry-after": "7"}), details=None)
+    assert _retry_after(hdr) == 7.0
+    info = SimpleNamespace(response=None, details={"error": {"details": [
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "13s"}]}})
+    assert _retry_after(info) == 13.0
+    assert _retry_after(SimpleNamespace(response=None, details=None)) is None
+
+def test_stream_model_resumes_after_midstream_failure(fake_client):
+    clean, _ = _collect(stream_model("gemini-2.5-flash", "tell me a story"))
+    fake_client.fail_streams = 1
+    text, final = _collect(stream_model("gemini-2.5-flash", "tell me a story"))
+    assert final["retry"].count == 1
+    assert final["usage"].total > 0
+    assert final["ttft_s"] is not None
+    assert text.startswith(clean[:len(clean) // 3])
+
+@pytest.mark.parametrize("attempts, expected", [
+    # resume point inside a double letter: nothing may be dropped
+    ((["He said ", "hel"], ["lo world"]), "He said hello world"),
+    # the model repeats the tail before continuing
+    ((["The quick ", "brown fox"], ["brown fox jumps", " over"]), "The quick brown fox jumps over"),
+    # first resumed chunk is all overlap; the next chunk must not be trimmed
+    ((["I said no "], ["I said no ", "no way"]), "I said no no way"),
+    # two failures in a row
+    ((["one two "], ["three "], ["four"]), "one two three four"),
+])
+def test_stream_model_resume_is_exact(fake_client, attempts, expected):
+    _scripted(fake_client, *attempts)
+    text, final = _collect(stream_model("gemini-2.5-flash", "p"))
+    assert text == expected
+    assert final["retry"].count == len(attempts) - 1
+
+def test_stream_models_fans_out_and_reports_errors(fake_client):
+    events = list(stream_models(["gemini-2.5-flash", "gemini-2.5-pro"], "compare me"))
+    finals = {i: ev for i, ev in events if isinstance(ev, dict)}
+    assert set(finals) == {0, 1}
+    assert all("usage" in ev for ev in finals.values())
+
+    def failing(*, model, contents, config=None):
+        yield SimpleNamespace(text="part ", usage_metadata=SimpleNamespace(
+            prompt_token_count=7, candidates_token_count=2, total_token_count=9))
+        raise ValueError("boom")
+    fake_client.models.generate_content_stream = failing
+    (_, text), (_, err) = list(stream_models(["gemini-2.5-flash"], "x"))
+    assert text == "part "
+    assert isinstance(err["error"], ValueError)
+    assert err["usage"].total == 9
+
+def test_stream_model_failure_carries_usage_and_retries(fake_client):
+    def stream(*, model, contents, config=None):
+        yield SimpleNamespace(text="x ", usage_metadata=SimpleNamespace(
+            prompt_token_count=40, candidates_token_count=5, total_token_count=45))
+        raise errors.ServerError(503, {"error": {"code": 503, "message": "down"}})
+    fake_client.models.generate_content_stream = stream
+    with pytest.raises(errors.ServerError) as info:
+        _collect(stream_model("gemini-2.5-flash", "p", max_retries=2))
+    assert info.value.usage.total == 3 * 45     # every attempt is billed
+    assert info.value.retry.count == 2
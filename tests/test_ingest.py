@@ -0,0 +1,69 @@
+# tests/test_ingest.py
+import io
+import math
+import wave
+
+import pytest
+
+from backend import ingest
+from backend.ingest import ingest_uploads, shrink_wav, sniff_mime, wav_duration
+
+
+def _wav(seconds=2.0, rate=44100, channels=2, width=2, speech=(0.5, 1.5)):
+    """Sine tone between `speech` seconds, silence elsewhere."""
+    frames = bytearray()
+    for i in range(int(rate * seconds)):
+        t = i / rate
+        v = int(12000 * math.sin(2 * math.pi * 440 * t)) if speech[0] <= t < speech[1] else 0
+        v = v >> (8 * (2 - width)) if width < 2 else v << (8 * (width - 2))
+        sample = ((v + 128) & 0xFF).to_bytes(1, "little") if width == 1 \
+            else v.to_bytes(width, "little", signed=True)
+        frames += sample * channels
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(width)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("data, name, mime", [
+    (b"%PDF-1.7\n", "x.bin", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n\0\0", "photo.jpg", "image/png"),
+    (b"\xff\xd8\xff\xe0", None, "image/jpeg"),
+    (b"RIFF\0\0\0\0WAVEfmt ", "a.mp3", "audio/wav"),
+    (b"\0\0\0\x20ftypM4A \0", "a.bin", "audio/mp4"),
+    (b"ID3\x04", None, "audio/mpeg"),
+    (b"plain text", "notes.txt", "text/plain"),
+    (b"\0\1\2", None, "application/octet-stream"),
+])
+def test_sniff_mime(data, name, mime):
+    assert sniff_mime(data, name) == mime
+
+@pytest.mark.parametrize("fast", [True, False])
+@pytest.mark.parametrize("width", [1, 2, 3, 4])
+def test_shrink_wav(monkeypatch, fast, width):
+    if fast and ingest.audioop is None:
+        pytest.skip("audioop not available")
+    if not fast:
+        monkeypatch.setattr(ingest, "audioop", None)
+    data = _wav(width=width)
+    out, steps = shrink_wav(data)
+    with wave.open(io.BytesIO(out), "rb") as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, 16000)
+    assert "2ch→mono" in steps and "44100→16000 Hz" in steps
+    assert any(s.startswith("trimmed") for s in steps)
+    # 1 s of tone plus PAD_MS either side survives the trim
+    assert 1.0 <= wav_duration(out) <= 1.0 + 2 * ingest.PAD_MS / 1000 + 0.05
+
+def test_shrink_wav_passes_through_unparseable():
+    assert shrink_wav(b"RIFF\0\0\0\0WAVEjunk") == (b"RIFF\0\0\0\0WAVEjunk", [])
+
+def test_ingest_uploads_keeps_order_and_shrinks(fake_client):
+    wav = _wav(seconds=1.0)
+    results = ingest_uploads([("a.wav", wav), ("b.pdf", b"%PDF-1.7\n"), ("c.wav", wav)])
+    assert [rep.name for _, rep in results] == ["a.wav", "b.pdf", "c.wav"]
+    assert [ref.mime_type for ref, _ in results] == ["audio/wav", "application/pdf", "audio/wav"]
+    assert results[0][1].saved_bytes > 0 and results[1][1].saved_bytes == 0
+    assert fake_client.upload_calls == 3
@@ -0,0 +1,41 @@
+# tests/test_profiler.py
+import time
+
+from frontend.profiler import RerunProfiler
+
+
+def _folded(path):
+    rows = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        stack, us = line.rsplit(" ", 1)
+        rows[stack] = rows.get(stack, 0) + int(us)
+    return rows
+
+def test_disabled_profiler_is_a_noop(tmp_path):
+    ss = {"session_id": "s"}
+    prof = RerunProfiler.start(None, ss, out_dir=str(tmp_path))
+    with prof.section("x"):
+        pass
+    prof.lap("setup", 0.1)
+    prof.flush()
+    assert not prof.enabled and list(tmp_path.iterdir()) == []
+
+def test_sections_are_written_as_collapsed_stacks(tmp_path):
+    ss = {"session_id": "s"}
+    t0 = time.perf_counter()
+    prof = RerunProfiler.start("1", ss, out_dir=str(tmp_path), t0=t0)
+    with prof.section("thumbnails"):
+        with prof.section("decode"):
+            time.sleep(0.01)
+    prof.lap("composer", time.perf_counter() - t0)
+    with prof.section("stream"):          # after the last mark
+        time.sleep(0.01)
+    prof.flush()
+
+    rows = _folded(tmp_path / "s.sections.folded")
+    assert rows["rerun;composer;thumbnails;decode"] >= 10_000
+    assert "rerun;composer;thumbnails" in rows
+    assert rows["rerun;after-composer;stream"] >= 10_000
+    sections = {r["section"] for r in prof.table()}
+    assert {"composer", "thumbnails", "thumbnails;decode", "stream"} <= sections
+    assert ss["profile_stats"]["stream"]["runs"] == 1
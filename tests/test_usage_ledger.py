@@ -0,0 +1,53 @@
+# tests/test_usage_ledger.py
+from backend.genai_backend import Usage
+from backend.usage_ledger import (
+    BATCH_DISCOUNT, Budget, Estimate, UsageLedger, estimate_request, load_rates, price
+)
+
+
+def _ledger():
+    return UsageLedger(":memory:", rates=load_rates())
+
+def test_record_and_spent():
+    ledger = _ledger()
+    cost = ledger.record("s1", "gemini-2.5-pro", Usage(prompt=1000, response=500, total=1500))
+    assert cost == price("gemini-2.5-pro", 1000, 500)
+    ledger.record("s2", "gemini-2.5-flash", Usage(prompt=1000, response=500, total=1500))
+    assert ledger.spent(session_id="s1") == cost
+    assert ledger.spent() > cost
+
+def test_check_allows_within_budget():
+    ledger = _ledger()
+    est = estimate_request("gemini-2.5-pro", "hello", rates=ledger.rates)
+    assert ledger.check("s", "gemini-2.5-pro", est, Budget(session_usd=1.0)).action == "allow"
+
+def test_check_walks_the_downgrade_chain():
+    ledger = _ledger()
+    est = Estimate(input_tokens=100_000, output_tokens=10_000,
+                   cost_usd=price("gemini-2.5-pro", 100_000, 10_000))
+    # too much for pro and 2.5 flash, fits 2.0 flash
+    budget = Budget(session_usd=price("gemini-2.0-flash", 100_000, 10_000) * 1.1)
+    d = ledger.check("s", "gemini-2.5-pro", est, budget)
+    assert (d.action, d.model) == ("downgrade", "gemini-2.0-flash")
+    assert d.estimate.cost_usd < est.cost_usd
+
+def test_check_blocks_when_nothing_fits_or_asked_to():
+    ledger = _ledger()
+    est = Estimate(input_tokens=100_000, output_tokens=10_000,
+                   cost_usd=price("gemini-2.5-pro", 100_000, 10_000))
+    assert ledger.check("s", "gemini-2.5-pro", est, Budget(session_usd=0.0)).action == "block"
+    assert ledger.check("s", "gemini-2.5-pro", est,
+                        Budget(session_usd=0.01, on_exceed="block")).action == "block"
+
+def test_ledger_path_expands_user(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    ledger = UsageLedger("~/.aurora/usage.sqlite3")
+    assert ledger.path == str(tmp_path / ".aurora" / "usage.sqlite3")
+    assert (tmp_path / ".aurora" / "usage.sqlite3").exists()
+
+def test_batch_turns_are_priced_at_the_batch_rate():
+    ledger = _ledger()
+    usage = Usage(prompt=10_000, response=2_000, total=12_000)
+    interactive = ledger.record("s", "gemini-2.5-pro", usage)
+    batch = ledger.record("s", "gemini-2.5-pro", usage, mode="batch")
+    assert batch == interactive * BATCH_DISCOUNT